@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import parser_gau as pgau
+import parse_cache as pcache
 import force_constant_mod as fc
 import numpy as np
 import average_across_types as aat
@@ -115,24 +116,23 @@ def main():
     f_qm_log = json_opts['files']['log_qm_file']
     f_qm_fchk = json_opts['files']['fchk_qm_file']
     f_atype = json_opts['files']['atype_file']
-    text_qm_log = pgau.store_any_file(f_qm_log)
-    text_qm_fchk = pgau.store_any_file(f_qm_fchk)
+    cache = json_opts.get('cache', False)
+    fchk_qm = pcache.open_fchk(f_qm_fchk, cache)
     text_atype = pgau.store_any_file(f_atype)
     print(text_atype)
     
-    N_atoms, qm_XYZ = pgau.read_XYZ(text_qm_fchk)
+    N_atoms, qm_XYZ = pgau.read_XYZ(fchk_qm)
     ele_list, atype_list = pgau.read_NamesTypes(text_atype)             
     # ele_list, type_list = pgau.read_NamesTypes(text_qm_log, N_atoms)
     print(atype_list)
-    ric_list, force_1D = pgau.read_RicDim_Grad(text_qm_fchk)
+    ric_list, force_1D = pgau.read_RicDim_Grad(fchk_qm)
     No_ric = ric_list[0]
     No_bonds = ric_list[1]
     No_angles = ric_list[2]
     No_dihes = ric_list[3]
 
     # # Reading in Topology in RIC from log file
-    chg = pgau.read_CM5(text_qm_log, N_atoms)
-    bond_list, angle_list, tors_list = pgau.read_Top(text_qm_log, ric_list)
+    chg, bond_list, angle_list, tors_list = pcache.read_log(f_qm_log, ric_list, N_atoms, cache)
     k_bonds = np.ones(No_bonds)                          
     k_angles = np.ones(No_angles)
     k_tors = np.ones(No_dihes)
@@ -141,11 +141,12 @@ def main():
     mdin = json_opts['opt']
     mode = json_opts['mode']
     print(mode, mdin)
-    bond_type_list, bond_arr, k_bond_arr = fc.set_bonds(qm_XYZ, None, atype_list, \
+    atype_table = fc.type_table(atype_list)
+    bond_type_list, bond_arr, k_bond_arr = fc.set_bonds(qm_XYZ, None, atype_table, \
                       bond_list, k_bonds, mdin, mode)
-    angle_type_list, angle_arr, k_angle_arr = fc.set_angles(qm_XYZ, None, atype_list, \
+    angle_type_list, angle_arr, k_angle_arr = fc.set_angles(qm_XYZ, None, atype_table, \
                       angle_list, k_angles, mdin, mode)
-    tors_type_list, v1, _, _, _, _, periodic_list = fc.set_torsion(qm_XYZ, atype_list, tors_list, k_tors, force_1D, mode)
+    tors_type_list, v1, _, _, _, _, periodic_list = fc.set_torsion(qm_XYZ, atype_table, tors_list, k_tors, force_1D, mode)
     
     # Take out Mirror atom types of bonds & angles
     bond_reduced, _ = aat.make_list_unique(bond_type_list, k_bond_arr)
@@ -160,7 +161,7 @@ def main():
                  chg)
     
     path = os.environ.get("g09root") + "/g09"
-    VDW_list = pgau.read_AmberParm(path, atype_list)
+    VDW_list = pcache.open_prm(path + '/amber.prm', cache).vdw(atype_list)
     
     print_GauNonBon(ele_list, atype_list, qm_XYZ, \
                  bond_reduced, bond_arr, \
@@ -8,24 +8,7 @@ SM=Smart_harmonic.py
 BS=build_4Smart.py
 $BS -f1 ${F1} -f2 ${F2} -path ${GPATH}
 
-for f in GauHarm.gjf GauNonBon.gjf
-do
-#   if [ -f "$f" ]
-#   then
-#       echo "Existing ${f} file"
-#       echo "Using $f file for ${SM}"
-#   else
-       echo "Executing Gaussian on ${f}"
-       ${GPATH}/g09 ${f}
-#   fi 
-done
-
-for f in GauHarm.chk GauNonBon.chk
-do
-   echo "Formatchecking $f file"
-   $GPATH/formchk -3 $f "${f%.chk}.fchk"
-done
-
+# GauHarm.gjf and GauNonBon.gjf are evaluated by SmartField_harmonic.py
 echo "Executing ${SM}"
 SmartField_harmonic.py $JSON 
-${GPATH}/g09 SmartField4gau.gjf
+gau_jobs.py SmartField4gau.gjf --exe ${GPATH}/g09
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 
 import parser_gau as pgau
+import parse_cache as pcache
 import force_constant_mod as fc
+import seminario_module as sem_mod
 import average_across_types as aat
 # import printout_mod as pout
 import os
 import readin_opts as rdin
 import print_top as top
 import log2topol
+import wilson_b as wb
+import amber_mm as amm
 import numpy as np
 # import scipy.optimize as optimize
 from scipy.sparse import rand
@@ -59,48 +63,69 @@ def main():
     f_qm_log = json_opts['files']['log_qm_file']
     f_qm_fchk = json_opts['files']['fchk_qm_file']
     f_atype = json_opts['files']['atype_file']
-    f_mm_fchk = json_opts['files']['fchk_mm_file']
-    f_nb_fchk = json_opts['files']['fchk_nb_file']
+    f_mm_fchk = json_opts['files'].get('fchk_mm_file')          # None: MM Hessian computed in-process
+    f_mm_gjf = json_opts['files'].get('gjf_mm_file')
+    f_nb_fchk = json_opts['files'].get('fchk_nb_file')
+    f_nb_gjf = json_opts['files'].get('gjf_nb_file')
+    nb_cutoff = json_opts.get('nb_cutoff')
+    cache = json_opts.get('cache', False)
     
     # Store all fiels in texts
-    text_qm_log = pgau.store_any_file(f_qm_log)
-    text_qm_fchk = pgau.store_any_file(f_qm_fchk)
     text_atype = pgau.store_any_file(f_atype)
-    text_mm_fchk = pgau.store_any_file(f_mm_fchk)
-    text_nb_fchk = pgau.store_any_file(f_nb_fchk)
+
+    # Index fchk files; sections are decoded on demand
+    # or read from the .npz sidecar if cache is on
+    fchk_qm = pcache.open_fchk(f_qm_fchk, cache)
+    fchk_mm = pcache.open_fchk(f_mm_fchk, cache) if f_mm_fchk else None
+    fchk_nb = pcache.open_fchk(f_nb_fchk, cache) if f_nb_fchk else None
     
     # Opening texts contents : XYZ, Grad, Hess, Topology & etc
-    N_atoms, qm_XYZ = pgau.read_XYZ(text_qm_fchk)                 
+    N_atoms, qm_XYZ = pgau.read_XYZ(fchk_qm)                 
     ele_list, atype_list = pgau.read_NamesTypes(text_atype)
-    ric_list, force_1D = pgau.read_RicDim_Grad(text_qm_fchk)
+    ric_list, force_1D = pgau.read_RicDim_Grad(fchk_qm)
     No_ric = ric_list[0]
     No_bonds = ric_list[1]
     No_angles = ric_list[2]
     No_dihes = ric_list[3]
 
     # Reading in Topology in RIC from log file
-    charge = pgau.read_CM5(text_qm_log, N_atoms)
-    bond_list, angle_list, tors_list = pgau.read_Top(text_qm_log, ric_list)
+    charge, bond_list, angle_list, tors_list = pcache.read_log(f_qm_log, ric_list, N_atoms, cache)
+
+    if fchk_nb is None:                                       # NonBon terms of the build_4Smart input
+        _, nb_types, nb_charges, nb_XYZ, nb_records = amm.read_gjf(f_nb_gjf)
+        _, grad_nb, hess_nb = amm.nonbonded_hessian(nb_XYZ, nb_types, nb_charges, np.reshape(bond_list, (-1, 2)) - 1,
+                                                    amm.SoftParams(nb_records), cutoff=nb_cutoff)
 
     if json_opts['opt'] == 'modsem':
         # Reading XYZ Hessians
-        hessXYZ_qm = pgau.read_HessXYZ(text_qm_fchk, N_atoms)
-        hessXYZ_nb = pgau.read_HessXYZ(text_nb_fchk, N_atoms)
-        # hessXYZ_mm = pgau.read_HessXYZ(text_mm_fchk, N_atoms)
+        hessXYZ_qm = pgau.read_HessXYZ(fchk_qm, N_atoms)
+        if fchk_nb is not None:
+            hessXYZ_nb = pgau.read_HessXYZ(fchk_nb, N_atoms)
+        else:
+            hessXYZ_nb = pgau.packed_HessXYZ(hess_nb[np.tril_indices(3 * N_atoms)], N_atoms)
+        # hessXYZ_mm = pgau.read_HessXYZ(fchk_mm, N_atoms)
         hess_eff = hessXYZ_qm - hessXYZ_nb 
         k_bonds = np.empty(len(bond_list))
         k_angles = np.empty(len(angle_list))
         k_tors = np.empty(len(tors_list))
-        diag_QM = np.diagonal(hessXYZ_qm)  
+        diag_QM = hessXYZ_qm.diagonal()
     else:
         # Reading RIC Hessians 
-        hessRIC_qm = pgau.read_HessRIC(text_qm_fchk, ric_list)
-        hessRIC_mm = pgau.read_HessRIC(text_mm_fchk, ric_list)
-        hessRIC_nb = pgau.read_HessRIC(text_nb_fchk, ric_list)
+        hessRIC_qm = wb.read_HessRIC(fchk_qm, ric_list, bond_list, angle_list, tors_list)
+        if fchk_mm is not None:
+            hessRIC_mm = wb.read_HessRIC(fchk_mm, ric_list, bond_list, angle_list, tors_list)
+        else:                                                 # Amber=SoftOnly terms of the build_4Smart input
+            _, mm_types, _, mm_XYZ, mm_records = amm.read_gjf(f_mm_gjf)
+            hessRIC_mm = amm.bonded_hessian_ric(mm_XYZ, mm_types, bond_list, angle_list, tors_list,
+                                                amm.SoftParams(mm_records))
+        if fchk_nb is not None:
+            hessRIC_nb = wb.read_HessRIC(fchk_nb, ric_list, bond_list, angle_list, tors_list)
+        else:
+            hessRIC_nb = amm.ric_hessian(nb_XYZ, grad_nb, hess_nb, bond_list, angle_list, tors_list)
         hess_eff = hessRIC_qm - hessRIC_nb
-        diag_QM = np.diagonal(hess_eff)                       # Take diagonal items of H_QM
-        MM_diag = get_DiagMatrix(hessRIC_mm)                  # Make sure H_MM is diagonal
-        coeffs = np.linalg.solve(MM_diag, diag_QM)            # Solve Linear System for Bond and Angles only H_MM*K = H_QM ; ignoring Torsion 
+        diag_QM = hess_eff.diagonal()                         # Take diagonal items of H_QM
+        MM_diag = hessRIC_mm.diagonal()                       # H_MM is taken as diagonal
+        coeffs = diag_QM / MM_diag                            # Solve Diagonal System for Bond and Angles only H_MM*K = H_QM ; ignoring Torsion 
         k_bonds = coeffs[0 : No_bonds]                        #  * ((627.509391)/(0.529117*0.529117))                       
         k_angles = coeffs[No_bonds : No_bonds + No_angles ]   #* (627.509391)
         k_tors = coeffs[No_ric - No_dihes : No_ric]           #* 627.509391  # Torsional Gradient; kcal/mol rad
@@ -108,9 +133,14 @@ def main():
     # If opt == sem
     mdin = json_opts['opt']
     mode = json_opts['mode']
-    bond_type_list, bond_arr, k_bond_arr = fc.set_bonds(qm_XYZ, hess_eff, atype_list, bond_list, k_bonds, mdin, mode)
-    angle_type_list, angle_arr, k_angle_arr = fc.set_angles(qm_XYZ, hess_eff, atype_list, angle_list, k_angles, mdin, mode)
-    tors_type_list, v1, v2, v3, tors_arr, phase, periodic_list = fc.set_torsion(qm_XYZ, atype_list, tors_list, k_tors, force_1D, mode)
+    if mdin == 'sem':                                         # Pair blocks decomposed once for bonds & angles
+        hess_eff = sem_mod.PairEigenCache(hess_eff)
+    atype_table = fc.type_table(atype_list)                   # Atom types interned once
+    bond_type_list, bond_arr, k_bond_arr = fc.set_bonds(qm_XYZ, hess_eff, atype_table, bond_list, k_bonds, mdin, mode)
+    angle_type_list, angle_arr, k_angle_arr = fc.set_angles(qm_XYZ, hess_eff, atype_table, angle_list, k_angles, mdin, mode)
+    if mdin == 'sem':
+        print('Seminario eigen cache: {pairs} pairs, {hits} hits, {misses} misses, {eig_calls} eig calls'.format(**hess_eff.stats()))
+    tors_type_list, v1, v2, v3, tors_arr, phase, periodic_list = fc.set_torsion(qm_XYZ, atype_table, tors_list, k_tors, force_1D, mode)
     
     # Take out mirrored atom types of bonds & angles
     bonds_unique, k_bonds_unique = aat.make_list_unique(bond_type_list, k_bond_arr)
@@ -134,7 +164,6 @@ def main():
     top.build_dihe_folder(fname, atype_list, charge)
     
     # Build topolo.txt file 
-    bond_list, angle_list, tors_list = log2topol.read_Top(text_qm_log)
     os.chdir('dihedrals')
     log2topol.print_topol(bond_list, angle_list, tors_list)
     
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
-import subprocess
 import os
-import glob
 import numpy as np
 import gauScan2com as scan2mm
+import gau_jobs as gjobs
+import adaptive_scan as adapt
+import scan_extract
 import readin_opts as rdin
+import amber_mm as amm
+import mm_scan
+import log2topol
 
 # import gcutil as gc
 # from openbabel import openbabel as ob
@@ -24,7 +28,7 @@ def printout_start():
     """)
 
 #    B3LYP/6-31G* EmpiricalDispersion=GD3  
-def print2QM(filename, data, tors_angle, nprocs, qm_method):
+def print2QM(filename, data, tors_angle, nprocs, qm_method, scan='S 10 36.0'):
     header = """%mem=1GB
 %nprocshared={}
 %chk={}.chk
@@ -41,10 +45,77 @@ Title
         for i in data:
             f.write(f"{i[0]}  {' '.join(map(str, i[1:]))}\n")
         f.write('\n')    
-        f.write('D ' + str(s) + ' S 10 36.0\n')
+        f.write('D ' + str(s) + ' ' + scan + '\n')       # F: held at the input value
         f.write('\n')    
         
 
+def adaptive_scans(file_qm_list, tors_mean_list, data, bond_idx, mm_energy, scan_opts, run_qm, nprocs, qm_method):
+    """
+    Refine the coarse scans round by round: fit the torsion to
+    QM - MM, then constrained optimizations at the angles where
+    the fit residual or its curvature is large, for
+    all scans at once, until the fit no longer changes.
+    mm_energy(id, frames) gives the MM energies of scan id.
+    (phi, QM, MM) of each scan, sorted by phi in (-180, 180]
+    """
+    ele = [row[0] for row in data]
+    scans = []
+    for id, f in enumerate(file_qm_list):
+        log_file = os.path.splitext(f)[0] + '.log'
+        res = scan_extract.read_scan(log_file)
+        _, coords = scan2mm.read_log(log_file)
+        n = min(len(res['energy']), len(coords))
+        scans.append({'phi': list(res['phi'][:n]), 'qm': list(res['energy'][:n]), 'coords': list(coords[:n]),
+                      'mm': list(mm_energy(id, coords[:n])) if n else [], 'coeffs': None,
+                      'done': n < 6})                         # Unfinished: fewer points than OPLS terms
+
+    for rnd in range(1, scan_opts['max_rounds'] + 1):
+        jobs = []
+        for id, scan in enumerate(scans):
+            if scan['done']:
+                continue
+            phi, qm, mm = (np.array(scan[k]) for k in ('phi', 'qm', 'mm'))
+            coeffs, resid = adapt.torsion_fit(phi, qm, mm)
+            change = np.inf if scan['coeffs'] is None else np.abs(coeffs - scan['coeffs']).max()
+            scan['coeffs'] = coeffs
+            targets = adapt.refine_angles(phi, resid, scan_opts) if change > scan_opts['coeff_tol'] else []
+            j, k = tors_mean_list[id][1] - 1, tors_mean_list[id][2] - 1
+            side = adapt.rotating_side(bond_idx, len(ele), j, k)
+            if side is None:
+                targets = []
+                print(f"Scan {id}: central bond in a ring, not refined")
+            print(f"Scan {id}, round {rnd}: {len(phi)} points, fit change {change:.3f} kcal/mol, "
+                  f"{len(targets)} new at {' '.join(f'{t:.1f}' for t in targets)}")
+            if not len(targets):
+                scan['done'] = True
+                continue
+            for m, t in enumerate(targets):
+                near = np.argmin(np.abs(np.mod(phi - t + 180, 360) - 180))
+                xyz = adapt.rotate_side(scan['coords'][near], j, k, side, t - phi[near])
+                fname = f'{id}_qm_r{rnd}_{m}.gjf'
+                print2QM(fname, [[e] + [f'{x:.6f}' for x in r] for e, r in zip(ele, xyz)],
+                         tors_mean_list[id], nprocs, qm_method, 'F')
+                jobs.append((id, t, fname))
+        if not jobs:
+            break
+        run_qm([fname for _, _, fname in jobs])
+        for id, t, fname in jobs:
+            res = adapt.read_constrained(os.path.splitext(fname)[0] + '.log')
+            if res is None:
+                print(f"No optimized point in {os.path.splitext(fname)[0]}.log, skipped")
+                continue
+            scans[id]['phi'].append(t)
+            scans[id]['qm'].append(res[0])
+            scans[id]['coords'].append(res[1])
+            scans[id]['mm'].append(mm_energy(id, res[1][None])[0])
+
+    results = []
+    for scan in scans:
+        phi = adapt.wrap_angle(scan['phi'])
+        order = np.argsort(phi, kind='stable')
+        results.append((phi[order], np.array(scan['qm'])[order], np.array(scan['mm'])[order]))
+    return results
+
 def read_XYZ(filename):
     with open(filename, 'r') as f:
         data = []
@@ -59,28 +130,7 @@ def read_XYZ(filename):
     
 
 def read_topology(filename):
-    with open(filename, 'r') as f:
-        bond_list = [] 
-        angle_list = []
-        tors_list = []
-        N_bonds = int(f.readline().split()[0])        
-        for i in range(0, N_bonds):
-            bond_list.append(f.readline().strip().split())
-        
-        b_list = [ list(map(int,x)) for x in bond_list ]
-
-        N_angles = int(f.readline().split()[0])       
-        for i in range(0, N_angles):
-            angle_list.append(f.readline().split())  
-        a_list = [ list(map(int,x)) for x in angle_list ] 
-        
-        N_tors = int(f.readline().split()[0]) 
-        for i in range(0, N_tors):
-            tors_list.append(f.readline().strip().split())
-        
-        t_list = [ list(map(int,x)) for x in tors_list ]
-        # tors_list = np.array([ i[] for i in tors_list ], dtype=float)
-        return t_list   
+    return log2topol.read_topol(filename)[2]
     
 
 def substitute_strings(indices, strings):
@@ -90,6 +140,73 @@ def substitute_strings(indices, strings):
         res.append(' '.join(substituted))
     return res
 
+def graph_classes(ele, bond_list):
+    """
+    Class ids (first seen order) of the atoms equivalent in the
+    bond graph (1 based pairs): the elements refined by the
+    classes of the bonded atoms until no class splits
+    """
+    neigh = [[] for _ in ele]
+    for i, j in bond_list:
+        neigh[i - 1].append(j - 1)
+        neigh[j - 1].append(i - 1)
+    labels = list(ele)
+    while True:
+        ids = {}
+        new = [ids.setdefault((labels[a], tuple(sorted(labels[b] for b in neigh[a]))), len(ids))
+               for a in range(len(ele))]
+        if len(ids) == len(set(labels)):
+            return new
+        labels = new
+
+def atom_labels(atypes, ele, bond_list):
+    """
+    Atom types merged over the graph classes: atoms of the same
+    type or equivalent in the bond graph share a label (the type
+    of the first of them), so that per atom types (C0, H1, ...)
+    still group the dihedrals of a methyl group
+    """
+    parent = list(range(len(atypes)))
+    def root(a):
+        while parent[a] != a:
+            a = parent[a]
+        return a
+    first = {}
+    for a, key in enumerate(zip(atypes, graph_classes(ele, bond_list))):
+        for k in (('type', key[0]), ('graph', key[1])):
+            ra, rb = root(a), root(first.setdefault(k, a))
+            parent[max(ra, rb)] = min(ra, rb)                 # Root: the first atom
+    return [atypes[root(a)] for a in range(len(atypes))]
+
+def torsion_key(tors, labels, neigh=None):
+    """
+    Direction invariant atom label key of a dihedral (1 based);
+    with the neighbour lists neigh, the sorted labels bonded to
+    its central atoms are part of it
+    """
+    fwd = tuple(labels[x - 1] for x in tors)
+    if neigh is None:
+        return min(fwd, fwd[::-1])
+    env = [tuple(sorted(labels[y - 1] for y in neigh[x])) for x in tors[1:3]]
+    return min((fwd, env[0], env[1]), (fwd[::-1], env[1], env[0]))
+
+def torsion_classes(tors_list, labels, bond_list=None):
+    """
+    Dihedrals grouped by torsion_key, classes and members in
+    first seen order; bond_list (1 based pairs) adds the
+    central bond environment to the key
+    """
+    neigh = None
+    if bond_list is not None:
+        neigh = {}
+        for i, j in bond_list:
+            neigh.setdefault(i, []).append(j)
+            neigh.setdefault(j, []).append(i)
+    classes = {}
+    for tors in tors_list:
+        classes.setdefault(torsion_key(tors, labels, neigh), []).append(tors)
+    return classes
+
 def replace_nth_tors(file_mm, tors_type):
     content =[]
     with open(file_mm, 'r') as f:
@@ -103,7 +220,7 @@ def replace_nth_tors(file_mm, tors_type):
      # split_content = [item.split() for item in content_tors]
     # Split each item of the list into a sublist based on space delimiter
     for line_idx, line in enumerate(content_tors):
-        if line[1:5] == tors_type:
+        if line[1:5] == tors_type or line[1:5] == tors_type[::-1]:
            arr_tmp = np.asarray(content_tors[line_idx][9:13])
            arr_float = arr_tmp.astype(float)
            # Replace elements different from 0.0 with 1.0
@@ -131,6 +248,11 @@ def main():
     file_ff_str = json_opts['files']['force_file']
     nprocs = json_opts['nprocs']
     qm_method = json_opts['method']
+    mm_engine = json_opts.get('mm_engine', 'native')          # 'gaussian': one g09 run per MM point
+    mm_relax = json_opts.get('mm_relax', False)                # native: relaxed MM, scanned dihedral held
+    scan_opts = adapt.options(json_opts)                      # None: fixed S 10 36.0 scans
+    if scan_opts is not None and mm_engine != 'native':
+        raise ValueError('adaptive_scan needs the native MM engine')
     
     data = read_XYZ(file_xyz)
     ele = [ i[0] for i in data ]
@@ -146,36 +268,52 @@ def main():
         ele_list.append(tmp_list)
 
     # Explicit tors_unique by element strings
-    ele_unique = tuple(set([tuple(i) for i in ele_list]))
+    ele_unique = tuple(dict.fromkeys(tuple(i) for i in ele_list))      # First seen order, same inputs every run
     ele_unique_list = [ list(i) for i in ele_unique]
     print(" Torsional Angles by Elements:")
     print(" ----------------------------\n")
     [print(i, ": ", *j) for i, j in enumerate(ele_unique_list)]
     print("")
     
-    tmp_center = tuple(set([tuple(i[1:3]) for i in tors_list]))
+    tmp_center = tuple(dict.fromkeys(tuple(i[1:3]) for i in tors_list))
     print(" Rotation Around Bonds:")
     print(" ----------------------\n") 
     [ print(" {}- {} ".format(i,j)) for i, j in tmp_center ]
     print("")
 
-    # Explicit tors_unique 
-    tors_mean_list = []
-    for i, x in enumerate(ele_unique_list, start=0):
-        for j, y in enumerate(ele_list, start=0):
-            if x == y:
-               tors_mean_list.append(tors_list[j])
-               break
+    # Reading in ff_string and type_charge files
+    atype_chg = scan2mm.read_txt_info(file_atype)
+    ffs = scan2mm.read_txt_info(file_ff_str)
+    atypes = [item[0].split('-')[0] for item in atype_chg]
+
+    # One scan per class of dihedrals equivalent by atom types or by the bond graph
+    # (either direction), optionally by the types bonded to the central atoms too
+    tors_env = json_opts.get('tors_environment', False)
+    bond_list = log2topol.read_topol(file_top)[0]
+    if len(set(atypes)) == len(atypes):
+        print(f" Warning: every atom has its own type in {file_atype}, dihedrals are classed "
+              f"by the atoms equivalent in the bond graph\n")
+    labels = atom_labels(atypes, ele, bond_list)
+    tors_classes = torsion_classes(tors_list, labels, bond_list if tors_env else None)
+    tors_mean_list = [members[0] for members in tors_classes.values()]
+    print(" Torsional Classes by Atom Types:")
+    print(" --------------------------------\n")
+    for i, members in enumerate(tors_classes.values()):
+        print(f" {i}: {' '.join(atypes[x - 1] for x in members[0])}  ({len(members)} dihedrals)")
+    print(f"\n {len(tors_list)} dihedrals in {len(tors_classes)} classes: {len(tors_classes)} QM scans, "
+          f"{len(tors_list) - len(tors_classes)} saved ({len(ele_unique_list)} scans by element tuples)\n")
 
     print(" Atomic indices in Torsional Angles:")
     print(" ---------------------------------------------\n")
     [ print(" {}- {}- {}- {} ".format(i,j, k, l)) for i,j,k,l in tors_mean_list ]
     print("")
     
-    # Reading in ff_string and type_charge files
-    atype_chg = scan2mm.read_txt_info(file_atype)
-    ffs = scan2mm.read_txt_info(file_ff_str)
-    atypes = [item[0].split('-')[0] for item in atype_chg]
+    if mm_engine == 'native':
+        _, charges = mm_scan.read_type_charge(atype_chg)
+        ff_records = mm_scan.read_ff(file_ff_str)
+        bond_idx = np.array(log2topol.read_topol(file_top)[0], dtype=int) - 1
+        prm_files = mm_scan.amber_prm_files(json_opts)          # Amber=SoftFirst fallback
+        prm = mm_scan.amber_prm(prm_files)
     
     # Replacing indices with string atype
     tors_tmp = substitute_strings(tors_mean_list, atypes)
@@ -186,49 +324,68 @@ def main():
     print("")
     
     # Writing QM Scan files for each torsional:
+    file_qm_list = []                                   # the order matters: id of tors_type_list
     for id, x in enumerate(tors_mean_list):
         fqm = str(id) + '_qm.gjf'
         # fmm = str(id) + '_zmat_mm.gjf'
-        print2QM(fqm, data, x, nprocs, qm_method)
+        print2QM(fqm, data, x, nprocs, qm_method, adapt.coarse_grid(scan_opts) if scan_opts else 'S 10 36.0')
+        file_qm_list.append(fqm)
     
-    GPATH = os.environ.get("g09root") + "/g09"
-    file_pattern = '*_qm.gjf*'
-    file_qm_list = sorted(glob.glob(file_pattern))      # the order matters
+    g09_exe = gjobs.gaussian_exe(json_opts)
+    cpu_budget = int(json_opts.get('cpu_budget', os.cpu_count()))     # nprocshared x concurrent jobs
     
-    # Calling Gaussian to perfrom Scan on each QM dihedral
+    # Jobs done in a previous run (same input, Normal termination) are skipped
+    state = gjobs.JobState(json_opts.get('state_file', 'build_dihes_state.json'))
+    cache = gjobs.open_cache(json_opts)           # Results of identical inputs, across runs and molecules
+
+    # Calling Gaussian to perfrom Scan on each QM dihedral, concurrently
+    failed = gjobs.failed_jobs(gjobs.run_jobs(g09_exe, file_qm_list, cpu_budget, 'Gaussian Scan', state, cache))
+    if failed:
+        raise RuntimeError(f"Gaussian Scan failed on {', '.join(failed)}: see their logs and {state.fname}")
+
+    # Adaptive: extra constrained optimizations where the coarse scans need them
+    if scan_opts is not None:
+        params_list = [amm.SoftParams(amm.silence_torsion(ff_records, tors_type_list[id]), prm, prm_files)
+                       for id in range(len(file_qm_list))]
+        mm_energy = lambda id, frames: mm_scan.mm_energies(frames, atypes, charges, bond_idx, params_list[id],
+                                                           mm_relax, tors_mean_list[id], int(nprocs))
+        run_qm = lambda files: gjobs.run_jobs(g09_exe, files, cpu_budget, 'Gaussian Refinement', state, cache)
+        adaptive_points = adaptive_scans(file_qm_list, tors_mean_list, data, bond_idx, mm_energy,
+                                         scan_opts, run_qm, nprocs, qm_method)
+
+    file_mm_all = []
     for id, f in enumerate(file_qm_list):
-        print(f"Executing Gaussian Scan on {f}")
         file_base = os.path.splitext(f)[0]
         log_file = file_base + '.log'  
-        
-    # Check if the log files exist 
-        if os.path.exists(log_file):
-            print(f"Log file {log_file} already exists.\n")
-        else:
-            process = subprocess.Popen([f"{GPATH}/g09", f], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()  # Wait for the process to finish
-            if process.returncode != 0:
-                print(f"Error executing Gaussian Scan on {f}. Details: {stderr.decode()}")
-            else:
-                print(f"Gaussian Scan executed successfully on {f}")
                 
+        # MM energies of all optimized points at once, n-th dihedral silenced
+        if mm_engine == 'native':
+            if scan_opts is not None:
+                phi, qm, mm = adaptive_points[id]
+            else:
+                params = amm.SoftParams(amm.silence_torsion(ff_records, tors_type_list[id]), prm, prm_files)
+                phi, qm, mm = mm_scan.scan_energies(log_file, atypes, charges, bond_idx, params,
+                                                    relax=mm_relax, nprocs=int(nprocs))
+            mm_scan.write_all(file_base[:-3] + '_all.csv', phi, qm, mm)
+            print(f"MM energies of {len(mm)} points written to {file_base[:-3]}_all.csv")
+            continue
+
         #  Creating MM input geometries for each QM file 
-        ele, coords, Natoms = scan2mm.read_log(log_file)
-        file_mm_list = scan2mm.print_mm(f, ele, coords, Natoms, atype_chg, ffs)
+        ele, coords = scan2mm.read_log(log_file)
+        file_mm_list = scan2mm.print_mm(f, ele, coords, atype_chg, ffs)
         
         # Silcening n-th dihedral by replacing with 0.0 barrier terms
         replace_item = tors_type_list[id]
         for idf, file in enumerate(file_mm_list):
             replace_nth_tors(file, replace_item)
-        
-        # Calling Gaussian to perform Optimization on each QM input for full scan 
-        # for jd, fj in enumerate(file_mm_list):
-            process = subprocess.Popen([f"{GPATH}/g09", file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()  # Wait for the process to finish
-            if process.returncode != 0:
-                print(f"Error executing MM Gaussian Optimization on {file}. Details: {stderr.decode()}")
-            else:
-                print(f"Gaussian Optimization executed successfully on {file}")
+        file_mm_all.extend(file_mm_list)
+
+    # Calling Gaussian on the MM inputs of all scans, concurrently
+    failed = gjobs.failed_jobs(gjobs.run_jobs(g09_exe, file_mm_all, cpu_budget, 'MM Gaussian', state, cache))
+    if failed:
+        raise RuntimeError(f"MM Gaussian failed on {', '.join(failed)}: see their logs and {state.fname}")
+    if cache is not None:
+        print(f"Result cache {cache.root}: {cache.hits} hits, {cache.misses} misses")
     
     
     # Conver to ZMAT by gcutils
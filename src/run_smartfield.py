@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import subprocess
-import os
 import readin_opts as rdin
 
 
@@ -24,7 +23,6 @@ def main():
     parser = rdin.commandline_parser3()
     opts = parser.parse_args()
 
-    GPATH = os.environ.get("g09root") + "/g09"
     SM = "Smart_harmonic.py"
     BS = "build_4Smart.py"
     JSON = opts.optfile
@@ -32,17 +30,10 @@ def main():
     # subprocess.run([BS, JSON, "-path", GPATH], check=True)
     subprocess.run([BS, JSON], check=True)
 
-    for f in ["GauHarm.gjf", "GauNonBon.gjf"]:
-        print(f"Executing Gaussian on {f}")
-        subprocess.run([f"{GPATH}/g09", f], check=True)
-
-    for f in ["GauHarm.chk", "GauNonBon.chk"]:
-        print(f"Formatchecking {f} file")
-        subprocess.run([f"{GPATH}/formchk", "-3", f, f"{os.path.splitext(f)[0]}.fchk"], check=True)
-
+    # GauHarm.gjf and GauNonBon.gjf are evaluated in-process by SmartField_harmonic.py
     print(f"Executing {SM}")
     subprocess.run(["SmartField_harmonic.py", JSON])
-    subprocess.run([f"{GPATH}/g09", "SmartField4gau.gjf"], check=True)
+    subprocess.run(["gau_jobs.py", "SmartField4gau.gjf"], check=True)      # Through the result cache, if $SMARTFIELD_CACHE is set
 
 if __name__ == "__main__":
     main()
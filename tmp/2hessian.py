@@ -1,89 +1,45 @@
 #!/usr/bin/env python3
 
-import numpy as np
-import pandas as pd
 import argparse
+import numpy as np
 import parser_gau as pgau
+import parse_cache as pcache
+import wilson_b as wb
 
 def commandline_parser():
     parser = argparse.ArgumentParser(prog='2hessian.py', formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument('-file',"--f", help='input file containig xyz coordinate')
+    parser.add_argument('-f', '--fchk', required=True, help='Gaussian fchk file (Freq)')
+    parser.add_argument('-l', '--log', required=True, help='Gaussian log file with the RIC table')
     return parser
 
-def calculate_wilson_b_matrix(cartesian_coordinates, internal_coordinates):
-    num_atoms = len(cartesian_coordinates)
-    num_internal_coords = len(internal_coordinates)
-    b_matrix = np.zeros((num_internal_coords, 3 * num_atoms))
-    
-    # Compute the partial derivatives of internal coordinates with respect to Cartesian coordinates
-    for i in range(num_internal_coords):
-        for j in range(3 * num_atoms):
-            # Here, you would compute the partial derivative based on the specific internal coordinate definition
-            # Update the B matrix accordingly
-            print("out<", i, j)
-            b_matrix[i][j] = compute_partial_derivative(internal_coordinates[i], cartesian_coordinates, j)
-    
-    return b_matrix
-
-def compute_partial_derivative(internal_coord, coords, j):
-    if internal_coord == 'bond_length':
-        atom1_index = 0  # index of the first atom in the bond
-        atom2_index = 1  # index of the second atom in the bond
-        print(atom1_index, atom2_index, j)
-        if j == 3 * atom1_index:
-            a = (coords[j] - coords[atom2_index])
-            # dist = np.linalg.norm(coords[atom1_index:atom1_index + 3] - coords[atom2_index:atom2_index + 3])
-            # dist = np.linalg.norm(coords[3* atom1_index:3*atom1_index + 3] - coords[3*atom2_index:3*atom2_index + 3])
-            # return(a/dist) 
-            return(1.0)
-            print("")
-            # return(a/dist)
-            # return (coords[j] - coords[3 * atom2_index]) / np.linalg.norm(
-            #     coords[3 * atom1_index:3 * atom1_index + 3] - coords[3 * atom2_index:3 * atom2_index + 3]
-            # )
-        elif j == 3 * atom2_index:
-        #     a = (coords[j] - coords[3 * atom2_index])
-        #     dist = np.linalg.norm(coords[3 * atom1_index:3 * atom1_index + 3] - coords[3 * atom2_index:3 * atom2_index + 3])
-        #     print(a/dist) 
-        #     print("")
-            return 2.0
-        #     print(coords[j])
-        #     return (coords[j] - coords[3 * atom1_index]) / np.linalg.norm(
-        #         coords[3 * atom1_index:3 * atom1_index + 3] - coords[3 * atom2_index:3 * atom2_index + 3]
-        #     )
-        else:
-            return 0.0  # derivative is 0 for other Cartesian coordinates
-    else:
-        return 0.0  # derivative is 0 for other internal coordinates
-
-
 def main():
+    """
+    Wilson B matrix of the RIC of the log, and the Cartesian
+    Hessian of the fchk transformed to RIC, compared with the
+    'Internal Force Constants' stored by Gaussian
+    """
     parser = commandline_parser()
     opts = parser.parse_args()
-    text_qm_fchk = pgau.store_any_file(opts.f)
-    N_atoms, qm_XYZ = pgau.read_XYZ(text_qm_fchk) 
-    ric_list, force_1D = pgau.read_RicDim_Grad(text_qm_fchk)
-    print(ric_list)
-    print(qm_XYZ)
-    print("")
-    print(qm_XYZ[0][:])
-
-
-    # Example internal coordinate definitions
-    # Replace these with your specific internal coordinate definitions
-    internal_coordinates = ['bond_length', 'bond_length', 'bond_length',
-                            'bond_angle', 'bond_angle', 'dihedral_angle']
-    # internal_coordinates = ['internal_coord_1', 'internal_coord_2', 'internal_coord_3']
-    
-    # Example Cartesian coordinates as a 1D array
-    # Replace this with your specific Cartesian coordinates
-    # Example: cartesian_coordinates = np.array([x1, y1, z1, x2, y2, z2, ...])
-    # cartesian_coordinates = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0])
-
-    # Calculate the Wilson B matrix
-    wilson_b_matrix = calculate_wilson_b_matrix(qm_XYZ, internal_coordinates)
-    print("Wilson B matrix:")
-    print(wilson_b_matrix)
+    fchk = pgau.FchkFile(opts.fchk)
+    N_atoms, qm_XYZ = pgau.read_XYZ(fchk)
+    ric_list, force_1D = pgau.read_RicDim_Grad(fchk)
+    charge, bond_list, angle_list, tors_list = pcache.read_log(opts.log, ric_list, N_atoms)
+
+    xyz_bohr = np.reshape(fchk.get_reals('Current cartesian coordinates'), (N_atoms, 3))
+    B = wb.wilson_B(xyz_bohr, *wb.ric_index(bond_list, angle_list, tors_list))
+    print(f'B matrix: {B.shape[0]} x {B.shape[1]}, {B.nnz} non zero')
+
+    stored = 'Internal Force Constants' in fchk
+    ref = pgau.read_HessRIC(fchk, ric_list) if stored else None
+    fchk.index.pop('Internal Force Constants', None)             # Force the transformation
+    hess_q = wb.read_HessRIC(fchk, ric_list, bond_list, angle_list, tors_list)
+    diag = hess_q.diagonal()
+    print(f'RIC Hessian diagonal (Hartree/Bohr^2, Hartree/rad^2): min {diag.min():.6f} max {diag.max():.6f}')
+    if stored:
+        diff = np.abs(hess_q.to_dense() - ref.to_dense())
+        print(f'Max deviation from Internal Force Constants: {diff.max():.3e}')
+    else:
+        print('No Internal Force Constants stored to compare with')
 
 if __name__ == "__main__":
     main()
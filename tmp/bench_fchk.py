@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import time
+import numpy as np
+import parser_gau as pgau
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='bench_fchk.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('fchk', nargs='*', help='fchk files to benchmark')
+    parser.add_argument('-n', '--natoms', type=int, default=500,
+                        help='atoms in the synthetic fchk; default = 500')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timing repeats')
+    return parser
+
+def write_section(fout, name, values):
+    fout.write(f'{name:<40}   R   N={len(values):>12}\n')
+    for i in range(0, len(values), 5):
+        fout.write(''.join(f'{x:16.8E}' for x in values[i:i+5]) + '\n')
+
+def write_synthetic_fchk(fname, N_atoms):
+    """
+    Fchk file with random coordinates and Hessian
+    """
+    rng = np.random.default_rng(0)
+    n_hess = 3 * N_atoms * (3 * N_atoms + 1) // 2
+    with open(fname, 'w') as fout:
+        fout.write('Synthetic fchk\n')
+        fout.write('Freq      RB3LYP                                                      def2TZVPP\n')
+        fout.write(f'{"Number of atoms":<40}   I     {N_atoms:>12}\n')
+        write_section(fout, 'Current cartesian coordinates', rng.normal(size=3 * N_atoms))
+        write_section(fout, 'Cartesian Force Constants', rng.normal(size=n_hess))
+        write_section(fout, 'Dipole Moment', rng.normal(size=3))
+
+def legacy_HessXYZ(fname, N_atom):
+    """
+    Former read_HessXYZ path: split, flat_list, np.array
+    and dense fill row by row
+    """
+    all_lines = pgau.store_any_file(fname)
+    hess_list = []
+    for s in range(len(all_lines)):
+        if 'Cartesian Force Constants' in all_lines[s]:
+            N_hess = int(all_lines[s][-10:])
+            nlines = int(N_hess/5.0) + 1
+            for e in pgau.range2(s + 1, s + nlines):
+                hess_list.append(all_lines[e].split())
+    hess_flat = pgau.flat_list(hess_list)
+    if len(hess_flat) != N_hess:
+        hess_flat = hess_flat[:N_hess]
+    hess_1D = np.array(hess_flat, float)
+    hess_1D = hess_1D * ((627.509391)/(0.529117*0.529117))
+    len_hess = 3*N_atom
+    hess_XYZ = np.zeros((len_hess, len_hess))
+    for i in range(len_hess + 1):
+        i_low = int( 0.5 * i * (i - 1)  )
+        i_up = int( 0.5 * i *  (i + 1)   )
+        hess_XYZ[i-1,0:i] =  hess_1D[i_low: i_up]
+        hess_XYZ[0:i,i-1] =  hess_1D[i_low: i_up]
+    return hess_XYZ
+
+def indexed_HessXYZ(fname, N_atom):
+    return pgau.read_HessXYZ(pgau.FchkFile(fname), N_atom)
+
+def best_time(func, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = func(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times), res
+
+def main():
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    files = list(opts.fchk)
+    synthetic = f'synthetic_{opts.natoms}.fchk'
+    write_synthetic_fchk(synthetic, opts.natoms)
+    files.append(synthetic)
+
+    print(f'{"file":<40} {"legacy (s)":>12} {"indexed (s)":>12} {"speedup":>8}')
+    for fname in files:
+        N_atoms, _ = pgau.read_XYZ(pgau.FchkFile(fname))
+        t_old, h_old = best_time(legacy_HessXYZ, opts.repeat, fname, N_atoms)
+        t_new, h_new = best_time(indexed_HessXYZ, opts.repeat, fname, N_atoms)
+        if not np.array_equal(h_old, h_new.to_dense()):
+            raise ValueError(f'Hessians differ for {fname}')
+        print(f'{os.path.basename(fname):<40} {t_old:12.4f} {t_new:12.4f} {t_old/t_new:8.1f}')
+    os.remove(synthetic)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+import numpy as np
+import parser_gau as pgau
+import seminario_module as sem_mod
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='bench_seminario.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--natoms', type=int, nargs='+', default=[100, 300, 1000],
+                        help='atoms of the synthetic Hessians; default = 100 300 1000')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timing repeats')
+    return parser
+
+def synthetic_system(N_atoms, rng):
+    """
+    Random coordinates and symmetric XYZ Hessian;
+    bonds to the 3 nearest neighbours, angles from bond pairs
+    """
+    coords = rng.uniform(0, 2.0 * N_atoms**(1/3), size=(N_atoms, 3))
+    n = 3 * N_atoms
+    hess = pgau.PackedSymmetricMatrix(rng.normal(size=n * (n + 1) // 2), n)
+    dist = np.linalg.norm(coords[:, None] - coords[None], axis=2)
+    np.fill_diagonal(dist, np.inf)
+    bonds = {tuple(sorted((i, j))) for i in range(N_atoms) for j in np.argsort(dist[i])[:3]}
+    bonds = np.array(sorted(bonds))
+    angles = [(a, j, b) for j in range(N_atoms)
+              for a in bonds[bonds[:, 1] == j, 0].tolist() + bonds[bonds[:, 0] == j, 1].tolist()
+              for b in bonds[bonds[:, 1] == j, 0].tolist() + bonds[bonds[:, 0] == j, 1].tolist() if a < b]
+    return coords, hess, bonds, np.array(angles)
+
+def per_term(coords, hess, bonds, angles):
+    """
+    Former path: one eig per block, one call per term
+    """
+    k_bonds = np.empty(len(bonds), dtype=complex)
+    for m, (i, j) in enumerate(bonds):
+        diff_AB = coords[i] - coords[j]
+        k_bonds[m] = sem_mod.get_ModSem_FcBonds(i, j, diff_AB, np.linalg.norm(diff_AB), hess)
+    k_angles = np.empty(len(angles), dtype=complex)
+    for m, (i, j, k) in enumerate(angles):
+        diff_AB = coords[i] - coords[j]
+        diff_BC = coords[j] - coords[k]
+        r_AB = np.linalg.norm(diff_AB)
+        r_BC = np.linalg.norm(diff_BC)
+        k_angles[m] = sem_mod.get_ModSem_FcAngles(i, j, k, r_AB, r_BC, diff_AB / r_AB, diff_BC / r_BC, hess)
+    return k_bonds.real, k_angles.real
+
+def batched(coords, hess, bonds, angles):
+    """
+    Batched path sharing one PairEigenCache
+    """
+    cache = sem_mod.PairEigenCache(hess)
+    k_bonds = sem_mod.ModSem_FcBonds(bonds, coords, cache)
+    k_angles = sem_mod.ModSem_FcAngles(angles, coords, cache)
+    return k_bonds, k_angles, cache.stats()
+
+def best_time(func, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = func(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times), res
+
+def main():
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f'{"atoms":>6} {"bonds":>6} {"angles":>7} {"per term (s)":>13} {"batched (s)":>12} {"speedup":>8}'
+          f' {"eig blocks":>11} {"cached":>7} {"hits":>6}')
+    for N_atoms in opts.natoms:
+        args = synthetic_system(N_atoms, rng)
+        t_old, (kb_old, ka_old) = best_time(per_term, opts.repeat, *args)
+        t_new, (kb_new, ka_new, stats) = best_time(batched, opts.repeat, *args)
+        if not (np.allclose(kb_old, kb_new, rtol=1e-10, atol=0) and np.allclose(ka_old, ka_new, rtol=1e-10, atol=0)):
+            raise ValueError(f'Force constants differ for {N_atoms} atoms')
+        n_blocks = 2 * (len(args[2]) + len(args[3]))                 # Decomposed by the per term path
+        print(f'{N_atoms:6d} {len(args[2]):6d} {len(args[3]):7d} {t_old:13.4f} {t_new:12.4f} {t_old/t_new:8.1f}'
+              f' {n_blocks:11d} {stats["misses"]:7d} {stats["hits"]:6d}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+import numpy as np
+import average_across_types as aat
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='check_make_list_unique.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--nterms', type=int, nargs='+', default=[100, 1000, 4000],
+                        help='terms in the random type lists; default = 100 1000 4000')
+    parser.add_argument('-t', '--trials', type=int, default=200, help='random lists checked per size')
+    return parser
+
+def legacy_get_one_hot(values, indexes):
+    one_hot = np.eye(np.max(indexes) + 1)[indexes]
+    counts = np.sum(one_hot, axis=0)
+    average = np.sum((one_hot.T * values), axis=1) / counts
+    average = average[~np.isnan(average)]             # Remove NaN 
+    return average
+
+def legacy_make_list_unique(var_list, k_values):
+    """
+    Former double loop over all split type lists
+    """
+    splitted = [ i.split() for i in var_list]
+    indexes = [i for i in range(len(splitted))]
+    id2del = list()
+    for i in range(len(splitted[:])-1):
+        for j in range(i+1,len(splitted[:])):
+            if (splitted[i] == splitted[j][::-1]) and (i !=j) :
+                id2del.append(j)
+                indexes[j] = indexes[i]
+                break
+    if len(id2del) != 0:
+        res_bonds = splitted.copy()
+        for n in range(len(id2del)):
+            j = id2del[n] - n
+            res_bonds.pop(j)
+        reduced = list(' '.join(item) for item in res_bonds)
+        indexes = np.array(indexes)
+        k_values_ave = legacy_get_one_hot(k_values, indexes)
+        return reduced, k_values_ave
+    else:
+        return var_list, k_values
+
+def random_types(rng, n_terms, n_types, unique):
+    """
+    Bond/angle/torsion type strings; unique=True mimics 'mean'
+    mode (sorted unique keys), otherwise 'all' mode repeats
+    """
+    width = rng.integers(2, 5)
+    terms = [' '.join(f'T{x}' for x in rng.integers(0, n_types, width)) for _ in range(n_terms)]
+    return sorted(set(terms)) if unique else terms
+
+def main():
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f'{"terms":>6} {"checked":>8} {"legacy (s)":>11} {"hashed (s)":>11}')
+    for n_terms in opts.nterms:
+        t_old = t_new = 0.0
+        for trial in range(opts.trials):
+            var_list = random_types(rng, n_terms, rng.integers(2, 12), trial % 2 == 0)
+            k_values = rng.normal(size=len(var_list))
+            t0 = time.perf_counter()
+            red_old, k_old = legacy_make_list_unique(var_list, k_values)
+            t1 = time.perf_counter()
+            red_new, k_new = aat.make_list_unique(var_list, k_values)
+            t2 = time.perf_counter()
+            t_old, t_new = t_old + t1 - t0, t_new + t2 - t1
+            if red_old != red_new or not np.allclose(k_old, k_new, rtol=1e-12, atol=1e-15):
+                raise ValueError(f'make_list_unique differs ({n_terms} terms, trial {trial})')
+        print(f'{n_terms:6d} {opts.trials:8d} {t_old:11.3f} {t_new:11.3f}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+import numpy as np
+import parser_gau as pgau
+import parse_cache as pcache
+import amber_mm as amm
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='check_mm_hessian.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-g', '--gjf', default='GauHarm.gjf', help='Amber=SoftOnly input of build_4Smart')
+    parser.add_argument('-f', '--fchk', default='GauHarm.fchk', help='Gaussian fchk of the same input (Freq)')
+    parser.add_argument('--nb', nargs=2, default=['GauNonBon.gjf', 'GauNonBon.fchk'],
+                        help='NonBon input of build_4Smart and its Gaussian fchk')
+    parser.add_argument('-q', '--qm', nargs=2, default=['but_qm.fchk', 'but_qm.log'], help='QM fchk and log (RIC)')
+    return parser
+
+def compare(label, energy, grad, hess, fchk, N_atoms):
+    ref = pgau.PackedSymmetricMatrix(fchk.get_reals('Cartesian Force Constants'), 3 * N_atoms).to_dense()
+    print(f'{label}: energy {energy:.10e}  Gaussian {fchk.get_scalar("Total Energy"):.10e}')
+    print(f'  gradient max deviation {np.abs(grad - fchk.get_reals("Cartesian Gradient")).max():.3e}')
+    print(f'  Hessian  max deviation {np.abs(hess - ref).max():.3e} (max |H| {np.abs(ref).max():.3e})')
+
+def main():
+    """
+    In-process bonded and nonbonded AMBER Hessians of the
+    build_4Smart inputs against the ones computed by Gaussian
+    """
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    fchk_qm = pgau.FchkFile(opts.qm[0])
+    N_atoms, _ = pgau.read_XYZ(fchk_qm)
+    ric_list, _ = pgau.read_RicDim_Grad(fchk_qm)
+    charge, bond_list, angle_list, tors_list = pcache.read_log(opts.qm[1], ric_list, N_atoms)
+    bond_idx = np.reshape(bond_list, (-1, 2)) - 1
+
+    _, types, _, xyz, records = amm.read_gjf(opts.gjf)
+    params = amm.SoftParams(records)
+    t0 = time.perf_counter()
+    energy, grad, hess = amm.bonded_hessian(xyz, types, bond_idx, params)
+    hess_q = amm.bonded_hessian_ric(xyz, types, bond_list, angle_list, tors_list, params)
+    print(f'In-process bonded Hessian: {time.perf_counter() - t0:.4f} s')
+    fchk = pgau.FchkFile(opts.fchk)
+    compare('Bonded', energy, grad, hess, fchk, N_atoms)
+    if 'Internal Force Constants' in fchk:
+        ref_q = pgau.read_HessRIC(fchk, ric_list).to_dense()
+        print(f'  RIC Hessian max deviation {np.abs(hess_q.to_dense() - ref_q).max():.3e}')
+
+    _, types, charges, xyz, records = amm.read_gjf(opts.nb[0])
+    t0 = time.perf_counter()
+    energy, grad, hess = amm.nonbonded_hessian(xyz, types, charges, bond_idx, amm.SoftParams(records))
+    print(f'In-process nonbonded Hessian: {time.perf_counter() - t0:.4f} s')
+    compare('Nonbonded', energy, grad, hess, pgau.FchkFile(opts.nb[1]), N_atoms)
+
+if __name__ == "__main__":
+    main()
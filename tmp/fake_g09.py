@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+import time
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import gau_jobs as gjobs
+import adaptive_scan as adapt
+from gauScan2com import atomic_number
+from internal_coords import InternalCoordinates
+
+NUMBERS = {v: int(k) for k, v in atomic_number.items()}
+ORIENT = """                          Input orientation:
+ ---------------------------------------------------------------------
+ Center     Atomic      Atomic             Coordinates (Angstroms)
+ Number     Number       Type             X           Y           Z
+ ---------------------------------------------------------------------
+"""
+
+
+def read_input(fname):
+    """
+    Elements, coordinates and ModRedundant fields of a gjf
+    """
+    with open(fname, 'r') as f:
+        lines = f.read().splitlines()
+    route = next(i for i, line in enumerate(lines) if line.startswith('#'))
+    blank = [i for i in range(route, len(lines)) if not lines[i].strip()]
+    rows = [line.split() for line in lines[blank[1] + 2:blank[2]]]
+    modred = lines[blank[2] + 1].split() if len(lines) > blank[2] + 1 else []
+    return [x[0].split('-')[0] for x in rows], np.array([x[1:4] for x in rows], dtype=float), modred
+
+def bonds(elements, coords):
+    """
+    Bonded pairs by distance
+    """
+    d = np.linalg.norm(coords[:, None] - coords[None], axis=2)
+    heavy = np.array([e != 'H' for e in elements])
+    cut = np.where(heavy[:, None] & heavy[None], 1.75, 1.25)
+    i, j = np.nonzero(np.triu(d < cut, k=1))
+    return np.stack((i, j), axis=1)
+
+def write_point(f, elements, xyz, energy):
+    f.write(f' SCF Done:  E(RPM6) = {energy: .12E} A.U. after   10 cycles\n')
+    f.write('                           !   Optimized Parameters   !\n')
+    f.write(ORIENT)
+    for n, (e, x) in enumerate(zip(elements, xyz), start=1):
+        f.write(f' {n:6d} {NUMBERS[e]:10d} {0:11d} {x[0]:15.6f} {x[1]:11.6f} {x[2]:11.6f}\n')
+    f.write(' ---------------------------------------------------------------------\n')
+
+def synthetic_log(fname, expr):
+    """
+    Scan ('D i j k l S n step') or constrained optimization
+    ('D i j k l F') log with the energy expr (kcal/mol) of the
+    dihedral phi (degrees), the geometries rigidly rotated
+    """
+    elements, coords, modred = read_input(fname)
+    dihe = np.array([int(x) for x in modred[1:5]]) - 1
+    j, k = dihe[1], dihe[2]
+    side = adapt.rotating_side(bonds(elements, coords), len(coords), j, k)
+    n, step = (int(modred[6]), float(modred[7])) if modred[5] == 'S' else (0, 0.0)
+    frames = [adapt.rotate_side(coords, j, k, side, m * step) for m in range(n + 1)]
+    phi = np.array([InternalCoordinates(x).dihedrals(dihe, signed=True)[0] for x in frames])
+    energy = -0.04 + np.array([eval(expr, vars(np), {'phi': np.radians(x)}) for x in phi]) / 627.5094740631
+    with open(os.path.splitext(fname)[0] + '.log', 'w') as f:
+        f.write(' The following ModRedundant input section has been read:\n')
+        f.write(f" {' '.join(modred)}\n \n")
+        f.write(' ! Name  Definition              Value          Derivative Info.                !\n')
+        f.write(' --------------------------------------------------------------------------------\n')
+        f.write(f" ! D1    D({','.join(modred[1:5])}){phi[0]:18.4f}         {'Scan' if n else 'Frozen'}                            !\n")
+        f.write(' --------------------------------------------------------------------------------\n')
+        for xyz, e in zip(frames, energy):
+            write_point(f, elements, xyz, e)
+        if n:
+            f.write(' Summary of Optimized Potential Surface Scan (add -0.0 to energies):\n')
+            for start in range(0, len(energy), 5):
+                f.write('     Eigenvalues --  ' + ''.join(f'{e:10.5f}' for e in energy[start:start + 5]) + '\n')
+        f.write(' Normal termination of Gaussian 09 (fake_g09)\n')
+
+def main():
+    """
+    Stand-in for g09 to test the job scheduler ("gaussian_exe"
+    in the json file): sleeps FAKE_G09_SECONDS (default 0.2) per
+    scan point and writes <input>.log, a copy of the log of the
+    same name in FAKE_G09_LOGS if there is one. With
+    FAKE_G09_TORSION (kcal/mol, numpy expression of phi in
+    radians) the scans and constrained optimizations are
+    synthesized with that torsion profile
+    """
+    fname = sys.argv[1]
+    base = os.path.splitext(fname)[0]
+    nprocs, n_atoms, points = gjobs.read_gjf_info(fname)
+    time.sleep(float(os.environ.get('FAKE_G09_SECONDS', 0.2)) * points)
+    ref = os.path.join(os.environ.get('FAKE_G09_LOGS', ''), base + '.log')
+    if os.environ.get('FAKE_G09_TORSION'):
+        synthetic_log(fname, os.environ['FAKE_G09_TORSION'])
+    elif os.environ.get('FAKE_G09_LOGS') and os.path.exists(ref):
+        shutil.copy(ref, base + '.log')
+    else:
+        with open(base + '.log', 'w') as f:
+            f.write(f' Entering Gaussian System, fake_g09 on {fname}\n')
+            f.write(f' NAtoms= {n_atoms} NProc= {nprocs} Points= {points}\n')
+            f.write(' Normal termination of Gaussian 09\n')
+    print(f'fake_g09: {fname}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import amber_mm as amm
+import fit4dihe as f4d
+import gau_jobs as gjobs
+
+DEFAULTS = {'coarse_steps': 8,             # Coarse scan points: S 7 45.0
+            'tol': 0.1,                    # kcal/mol, interpolation error / fit residual
+            'min_step': 7.5,               # degrees, smallest refined interval half width
+            'max_new': 4,                  # points per scan per round
+            'max_points': 16,              # distinct angles per scan
+            'max_rounds': 4,
+            'coeff_tol': 0.05}             # kcal/mol, fit converged
+
+
+def options(json_opts):
+    """
+    "adaptive_scan" of the json file over DEFAULTS, None when
+    absent (fixed S 10 36.0 scans)
+    """
+    opts = json_opts.get('adaptive_scan')
+    if opts is None:
+        return None
+    return {**DEFAULTS, **opts}
+
+def coarse_grid(opts):
+    """
+    ModRedundant scan of the coarse pass: coarse_steps points
+    over a full turn, without repeating the start at +360
+    """
+    n = opts['coarse_steps']
+    return f"S {n - 1} {360 / n:.1f}"
+
+def wrap_angle(phi):
+    """
+    Angles (degrees) in (-180, 180]
+    """
+    return 180 - np.mod(180 - np.asarray(phi, dtype=float), 360)
+
+def rotating_side(bond_idx, N_atoms, j, k):
+    """
+    Zero based atoms on the k side of the j-k bond, None if
+    the bond is in a ring
+    """
+    neigh = [[] for _ in range(N_atoms)]
+    for a, b in np.asarray(bond_idx, dtype=int).reshape(-1, 2).tolist():
+        neigh[a].append(b)
+        neigh[b].append(a)
+    side, stack = {k}, [k]
+    while stack:
+        a = stack.pop()
+        for b in neigh[a]:
+            if a == k and b == j:
+                continue
+            if b == j:
+                return None
+            if b not in side:
+                side.add(b)
+                stack.append(b)
+    return np.array(sorted(side))
+
+def rotate_side(coords, j, k, side, delta):
+    """
+    coords with the side atoms turned by delta (degrees) about
+    the j-k axis: the dihedrals i-j-k-l grow by delta
+    """
+    axis = coords[k] - coords[j]
+    axis /= np.linalg.norm(axis)
+    t = np.radians(delta)
+    v = coords[side] - coords[k]
+    rot = v * np.cos(t) + np.cross(axis, v) * np.sin(t) + np.outer(v @ axis, axis) * (1 - np.cos(t))
+    out = np.array(coords, dtype=float)
+    out[side] = coords[k] + rot
+    return out
+
+def read_constrained(log_file):
+    """
+    Energy (last SCF Done, Hartree) and last input orientation
+    of a constrained optimization log; None if it did not end
+    normally
+    """
+    if not gjobs.normal_termination(log_file):
+        return None
+    energy, coords = None, None
+    with open(log_file, 'r') as f:
+        for line in f:
+            if line.startswith(' SCF Done:'):
+                energy = float(line.split('=')[1].split()[0])
+            elif 'Input orientation:' in line:
+                for _ in range(4):                              # Table header
+                    f.readline()
+                block = []
+                for row in f:
+                    if '----' in row:
+                        break
+                    block.append(row.split()[3:6])
+                coords = np.array(block, dtype=float)
+    if energy is None or coords is None:
+        return None
+    return energy, coords
+
+def torsion_fit(phi, qm, mm):
+    """
+    OPLS coefficients (fit4dihe) of QM - MM and residuals at
+    the points, kcal/mol
+    """
+    y = ((qm - qm.min()) - (mm - mm.min())) * amm.HARTREE
+    A = f4d.oplsa_matrix(np.asarray(phi), None)
+    coeffs = np.linalg.lstsq(A, y, rcond=None)[0]
+    return coeffs, y - A @ coeffs
+
+def fourier_curvature(phi, energy, order=4):
+    """
+    d2E/dphi2 (per rad^2) of a least squares Fourier series of
+    the profile energy(phi), order up to half the points
+    """
+    x = np.radians(phi)
+    m = max(1, min(order, len(np.unique(np.round(np.mod(phi, 360), 6))) // 2))
+    n = np.arange(1, m + 1)
+    A = np.hstack((np.ones((len(x), 1)), np.cos(np.outer(x, n)), np.sin(np.outer(x, n))))
+    c = np.linalg.lstsq(A, energy, rcond=None)[0]
+    a, b = c[1:m + 1], c[m + 1:]
+    def d2(t):
+        t = np.radians(np.atleast_1d(t))
+        return -(np.cos(np.outer(t, n)) * a * n**2 + np.sin(np.outer(t, n)) * b * n**2).sum(axis=1)
+    return d2
+
+def refine_angles(phi, resid, opts):
+    """
+    Midpoints of the (periodic) intervals between the scanned
+    angles where the fit residual at an end, or its
+    interpolation error |r''| h^2 / 8 (the curvature of the
+    energy the torsion model misses, large at the barriers and
+    minima it does not follow), exceeds tol; largest first,
+    angles in [phi[0], phi[0] + 360)
+    """
+    a = np.round(np.mod(np.asarray(phi) - phi[0], 360), 6)
+    ang, inv = np.unique(a, return_inverse=True)
+    res = np.zeros(len(ang))
+    np.maximum.at(res, inv, np.abs(resid))
+    h = np.mod(np.roll(ang, -1) - ang, 360)
+    h[h == 0] = 360                                             # A single angle
+    mid = ang + h / 2
+    err = np.abs(fourier_curvature(phi, resid)(phi[0] + mid)) * np.radians(h)**2 / 8
+    score = np.maximum(err, np.maximum(res, np.roll(res, -1)))
+    pick = np.flatnonzero((h / 2 >= opts['min_step']) & (score > opts['tol']))
+    room = max(0, opts['max_points'] - len(ang))
+    pick = pick[np.argsort(-score[pick])][:min(opts['max_new'], room)]
+    return np.sort(phi[0] + np.mod(mid[pick], 360))
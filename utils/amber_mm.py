@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+import wilson_b as wb
+from term_table import TypeTable
+
+BOHR = 0.52917721092                                        # Ang per Bohr
+HARTREE = 627.5094740631                                    # kcal/mol per Hartree
+
+
+def read_gjf(fname):
+    """
+    Gaussian Amber=SoftOnly input: elements, types, charges,
+    coordinates (Ang) and the soft parameter lines by kind
+    """
+    with open(fname, 'r') as f:
+        lines = f.read().splitlines()
+    n = next(i for i, line in enumerate(lines) if line.startswith('#'))
+    blank = [i for i in range(n, len(lines)) if not lines[i].strip()]
+    elements, types, charges, coords = [], [], [], []
+    for line in lines[blank[1] + 2:blank[2]]:                 # Skip title and charge/multiplicity
+        x = line.split()
+        element, atype, charge = x[0].split('-', 2)
+        elements.append(element)
+        types.append(atype)
+        charges.append(float(charge))
+        coords.append([float(c) for c in x[1:4]])
+    return elements, types, np.array(charges), np.array(coords), soft_records(lines[blank[2] + 1:])
+
+def soft_records(lines):
+    """
+    Soft parameter lines (e.g. ff_string.txt) by kind,
+    fields after the keyword; '!' starts a comment
+    """
+    records = {}
+    for line in lines:
+        x = line.split('!')[0].split()
+        if x:
+            records.setdefault(x[0], []).append(x[1:])
+    return records
+
+
+class SoftParams:
+    """
+    Soft parameters of a Gaussian Amber input by kind, matched
+    to terms by type, as written or reversed (X-b-c-X generic
+    torsions last). With an AmberParm fallback, the missing
+    types are taken from amber.prm, as Amber=SoftFirst does;
+    searched names the amber.prm files looked for in vain
+    """
+
+    def __init__(self, records, fallback=None, searched=()):
+        self.records = records
+        self.fallback = fallback
+        self.searched = list(searched)
+        self._index = {}
+
+    def index(self, kind, width):
+        if kind not in self._index:
+            table = {}
+            for rec in self.records.get(kind, []):
+                key, values = tuple(rec[:width]), [float(v) for v in rec[width:]]
+                table.setdefault(key, values)                 # First definition wins
+                table.setdefault(key[::-1], values)
+            self._index[kind] = table
+        return self._index[kind]
+
+    def lookup(self, kind, types):
+        table = self.index(kind, len(types))
+        if types in table:
+            return table[types]
+        generic = ('X',) + types[1:3] + ('X',)
+        if kind == 'AmbTrs' and generic in table:
+            return table[generic]
+        if self.fallback is not None:
+            if kind == 'VDW':
+                rec = (self.fallback.index('VDW').get(types[0]) or [None])[0]
+            else:
+                rec = {'HrmStr1': self.fallback.bond, 'HrmBnd1': self.fallback.angle,
+                       'AmbTrs': self.fallback.torsion}[kind](*types)
+            if rec is not None:
+                return [float(v) for v in rec[len(types) + 1:]]
+        return None
+
+    def match(self, kind, term_types, width):
+        """
+        (n_terms, n_values) parameters of the type labels
+        term_types; KeyError on a missing type
+        """
+        found = {}
+        for x in set(term_types):
+            found[x] = self.lookup(kind, tuple(x.split()))
+        missing = [x for x, values in found.items() if values is None]
+        if missing:
+            msg = f'No {kind} parameters for {", ".join(sorted(missing))}'
+            if self.fallback is None and self.searched:
+                msg += (' in the soft parameters, and no amber.prm to fall back on: '
+                        f'{", ".join(self.searched)} not found (set "amber_prm" in the json file, --prm of mm_scan.py or $g09root)')
+            raise KeyError(msg)
+        return np.array([found[x] for x in term_types], dtype=float).reshape(len(term_types), -1)
+
+
+def silence_torsion(records, tors_type):
+    """
+    Copy of records with the barriers of the first AmbTrs
+    record of tors_type (either direction) set to 0.0, as
+    build_dihes.replace_nth_tors does on the input files
+    """
+    records = dict(records)
+    tors = [list(rec) for rec in records.get('AmbTrs', [])]
+    for rec in tors:
+        if rec[:4] in (list(tors_type), list(tors_type)[::-1]):
+            rec[8:12] = ['0.0'] * 4
+            break
+    records['AmbTrs'] = tors
+    return records
+
+
+def topology(bond_idx, N_atoms):
+    """
+    Angles and proper dihedrals (zero based) of the bond
+    graph, as the MM engine of Gaussian builds them
+    """
+    neigh = [[] for _ in range(N_atoms)]
+    for i, j in np.asarray(bond_idx, dtype=int).reshape(-1, 2).tolist():
+        neigh[i].append(j)
+        neigh[j].append(i)
+    angles = [(i, j, k) for j in range(N_atoms) for i in neigh[j] for k in neigh[j] if i < k]
+    dihes = [(i, j, k, l) for j, k in np.asarray(bond_idx, dtype=int).reshape(-1, 2).tolist()
+             for i in neigh[j] if i != k for l in neigh[k] if l != j and l != i]
+    return np.array(angles, dtype=int).reshape(-1, 3), np.array(dihes, dtype=int).reshape(-1, 4)
+
+def bonded_params(atom_types, bond_idx, params):
+    """
+    Zero based index arrays and parameters of the HrmStr1,
+    HrmBnd1 and AmbTrs terms
+    """
+    table = TypeTable(atom_types)
+    bond_idx = np.asarray(bond_idx, dtype=int).reshape(-1, 2)
+    angle_idx, dihe_idx = topology(bond_idx, len(atom_types))
+    return ((bond_idx, params.match('HrmStr1', table.terms(bond_idx), 2)),
+            (angle_idx, params.match('HrmBnd1', table.terms(angle_idx), 3)),
+            (dihe_idx, params.match('AmbTrs', table.terms(dihe_idx), 4)))
+
+def bonded_terms(coords, atom_types, bond_idx, params):
+    """
+    Zero based index arrays, values q and parameters of the
+    HrmStr1, HrmBnd1 and AmbTrs terms; angles in radians
+    """
+    matched = bonded_params(atom_types, bond_idx, params)
+    q = wb.ric_values(coords, *[idx for idx, _ in matched])
+    return tuple((idx, x, p) for (idx, p), x in zip(matched, q))
+
+def energy_derivatives(terms):
+    """
+    E, dE/dq and d2E/dq2 (kcal/mol, Ang, rad) of each term:
+    k (r - r0)^2, k (theta - theta0)^2 and
+    sum_n V_n / NPaths (1 + cos(n phi - phase_n))
+    """
+    (_, r, p_b), (_, theta, p_a), (_, phi, p_t) = terms
+    dr = r - p_b[:, 1]
+    dtheta = theta - np.radians(p_a[:, 1])
+    n = np.arange(1, 5)
+    arg = n * phi[:, None] - np.radians(p_t[:, :4])
+    V = p_t[:, 4:8] / p_t[:, 8:9]
+    return ((p_b[:, 0] * dr**2, 2 * p_b[:, 0] * dr, 2 * p_b[:, 0]),
+            (p_a[:, 0] * dtheta**2, 2 * p_a[:, 0] * dtheta, 2 * p_a[:, 0] * np.ones_like(theta)),
+            ((V * (1 + np.cos(arg))).sum(axis=1), -(n * V * np.sin(arg)).sum(axis=1),
+             -(n**2 * V * np.cos(arg)).sum(axis=1)))
+
+def bonded_energies(frames, atom_types, bond_idx, params):
+    """
+    Stretching, bending and torsion energies (Hartree) of each
+    frame of frames (n_frames, N, 3), Ang; all frames in one pass
+    """
+    frames = np.asarray(frames, dtype=float)
+    n_frames, N_atoms = frames.shape[:2]
+    terms = bonded_terms(frames[0], atom_types, bond_idx, params)
+    offset = N_atoms * np.arange(n_frames)
+    batch = [(idx[None] + offset[:, None, None]).reshape(-1, idx.shape[1]) for idx, _, _ in terms]
+    q = wb.ric_values(frames.reshape(-1, 3), *batch)
+    terms = [(idx, x, np.tile(p, (n_frames, 1))) for (_, _, p), idx, x in zip(terms, batch, q)]
+    return [E.reshape(n_frames, -1).sum(axis=1) / HARTREE for E, _, _ in energy_derivatives(terms)]
+
+def bonded_hessian(coords, atom_types, bond_idx, params):
+    """
+    Energy (Hartree), Cartesian gradient (Hartree/Bohr, 3N) and
+    Hessian (Hartree/Bohr^2, 3N x 3N) of the bonded AMBER terms,
+    coords in Ang; the Gaussian Amber=SoftOnly numbers
+    """
+    coords = np.asarray(coords, dtype=float)
+    terms = bonded_terms(coords, atom_types, bond_idx, params)
+    energy, grad, hess = 0.0, np.zeros(coords.size), np.zeros((coords.size, coords.size))
+    for (idx, _, _), (E, dE, d2E), func in zip(terms, energy_derivatives(terms), wb.ROW_FUNCS):
+        if not len(idx):
+            continue
+        d = func(coords, idx).reshape(len(idx), -1)             # dq/dx, (n, 3w)
+        d2 = wb.local_second_derivatives(func, coords, idx)     # d2q/dx2, (n, 3w, 3w)
+        blocks = d2E[:, None, None] * d[:, :, None] * d[:, None, :] + dE[:, None, None] * d2
+        cols = wb.local_columns(idx)
+        energy += E.sum()
+        np.add.at(grad, cols, dE[:, None] * d)
+        np.add.at(hess, (cols[:, :, None], cols[:, None, :]), blocks)
+    return energy / HARTREE, grad * BOHR / HARTREE, hess * BOHR**2 / HARTREE
+
+def ric_hessian(coords, grad_x, hess_x, bond_list, angle_list, dihe_list):
+    """
+    Cartesian MM gradient and Hessian (Hartree/Bohr) in the RIC
+    of read_Top (flat, 1 based), Hartree/Bohr^2 and Hartree/rad^2,
+    as Gaussian stores it in 'Internal Force Constants'
+    """
+    ric_idx = wb.ric_index(bond_list, angle_list, dihe_list)
+    xyz_bohr = np.asarray(coords, dtype=float) / BOHR
+    B = wb.wilson_B(xyz_bohr, *ric_idx)
+    grad_q = wb.cart2ric_gradient(B, grad_x)
+    return wb.cart2ric_hessian(B, hess_x, K=wb.gradient_term(xyz_bohr, ric_idx, grad_q))
+
+def bonded_hessian_ric(coords, atom_types, bond_list, angle_list, dihe_list, params):
+    """
+    Bonded AMBER Hessian in the RIC; the MM terms follow the bonds
+    """
+    bond_idx = np.reshape(bond_list, (-1, 2)) - 1
+    _, grad_x, hess_x = bonded_hessian(coords, atom_types, bond_idx, params)
+    return ric_hessian(coords, grad_x, hess_x, bond_list, angle_list, dihe_list)
+
+
+def nonbon_scales(params):
+    """
+    VDW and Coulomb scale factors of 1-2, 1-3 and 1-4 pairs of
+    the NonBon master function; a negative value v means 1/|v|
+    """
+    rec = params.records.get('NonBon')
+    if not rec:
+        raise KeyError('No NonBon master function')
+    x = [float(v) for v in rec[0]]
+    if int(x[0]) != 3 or int(x[1]) != 1:
+        raise ValueError(f'NonBon V-Type {int(x[0])} C-Type {int(x[1])}: only Amber (3 1) is supported')
+    scale = [1 / abs(v) if v < 0 else v for v in x[4:10]]
+    return np.array(scale[:3] + [1.0]), np.array(scale[3:] + [1.0])
+
+def separation_pairs(bond_idx, N_atoms):
+    """
+    Sorted keys i * N + j (i < j) of the pairs 1, 2 and 3
+    bonds apart (shortest path) in the bond graph
+    """
+    bond_idx = np.asarray(bond_idx, dtype=int).reshape(-1, 2)
+    ones = np.ones(len(bond_idx))
+    A = sparse.csr_matrix((ones, (bond_idx[:, 0], bond_idx[:, 1])), shape=(N_atoms, N_atoms))
+    W = (A + A.T + sparse.identity(N_atoms, format='csr')).astype(bool).astype(int)
+    reach, seen, keys = W, np.zeros(0, dtype=np.int64), []
+    for _ in range(3):                                       # Within n bonds, minus within n - 1
+        upper = sparse.triu(reach, k=1).tocoo()
+        within = np.sort(upper.row.astype(np.int64) * N_atoms + upper.col)
+        keys.append(np.setdiff1d(within, seen, assume_unique=True))
+        seen = within
+        reach = (reach @ W).astype(bool).astype(int)
+    return keys
+
+def pair_chunks(coords, cutoff=None, chunk=1 << 16):
+    """
+    (i, j) arrays, i < j, of all pairs in blocks of about chunk
+    pairs, or of the pairs within cutoff (Ang) from a k-d tree
+    """
+    N_atoms = len(coords)
+    if cutoff:
+        pairs = cKDTree(coords).query_pairs(cutoff, output_type='ndarray')
+        for start in range(0, len(pairs), chunk):
+            yield pairs[start:start + chunk, 0], pairs[start:start + chunk, 1]
+        return
+    rows = max(1, chunk // max(N_atoms, 1))
+    for start in range(0, N_atoms, rows):
+        i, j = np.nonzero(np.arange(start, min(start + rows, N_atoms))[:, None] < np.arange(N_atoms))
+        yield i + start, j
+
+def nonbonded_params(atom_types, charges, params):
+    """
+    Per atom charges, R_i and sqrt(eps_i), and the VDW and
+    Coulomb scale factors by bond separation
+    """
+    scale_v, scale_c = nonbon_scales(params)
+    vdw = params.match('VDW', list(atom_types), 1)
+    return np.asarray(charges, dtype=float), vdw[:, 0], np.sqrt(vdw[:, 1]), scale_v, scale_c
+
+def scaled_pairs(i, j, special, scale_v, scale_c, N_atoms):
+    """
+    Pairs i < j with a non zero scale factor and their VDW and
+    Coulomb scales; special = (sorted keys, separation index)
+    """
+    keys, sep = special
+    key = i.astype(np.int64) * N_atoms + j
+    if len(keys):
+        pos = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+        kind = np.where(keys[pos] == key, sep[pos], 3)
+    else:
+        kind = np.full(len(key), 3)
+    sv, sc = scale_v[kind], scale_c[kind]
+    keep = (sv != 0) | (sc != 0)
+    return i[keep], j[keep], sv[keep], sc[keep]
+
+def special_pairs(bond_idx, N_atoms):
+    """
+    1-2, 1-3 and 1-4 keys of separation_pairs, sorted, with
+    their separation index 0, 1, 2
+    """
+    special = separation_pairs(bond_idx, N_atoms)
+    keys = np.concatenate(special)
+    sep = np.concatenate([np.full(len(k), n) for n, k in enumerate(special)])
+    order = np.argsort(keys)
+    return keys[order], sep[order]
+
+def nonbonded_hessian(coords, atom_types, charges, bond_idx, params, cutoff=None, chunk=1 << 16):
+    """
+    Energy (Hartree), Cartesian gradient (Hartree/Bohr, 3N) and
+    Hessian (Hartree/Bohr^2, 3N x 3N) of the NonBon master
+    function: Coulomb q_i q_j / r and Amber LJ
+    eps_ij ((R_ij/r)^12 - 2 (R_ij/r)^6), R_ij = R_i + R_j,
+    eps_ij = sqrt(eps_i eps_j), with the 1-2, 1-3 and 1-4 scale
+    factors; coords in Ang, pairs as in pair_chunks
+    """
+    coords = np.asarray(coords, dtype=float)
+    N_atoms = len(coords)
+    charges, radius, depth, scale_v, scale_c = nonbonded_params(atom_types, charges, params)
+    special = special_pairs(bond_idx, N_atoms)
+
+    energy = 0.0
+    grad = np.zeros((N_atoms, 3))
+    diag = np.zeros((N_atoms, 3, 3))
+    hess = np.zeros((3 * N_atoms, 3 * N_atoms))
+    for i, j in pair_chunks(coords, cutoff, chunk):
+        i, j, sv, sc = scaled_pairs(i, j, special, scale_v, scale_c, N_atoms)
+        d = coords[i] - coords[j]
+        r = np.linalg.norm(d, axis=1)
+        u = d / r[:, None]
+        E_c = HARTREE * BOHR * sc * charges[i] * charges[j] / r
+        eps = sv * depth[i] * depth[j]
+        s6 = ((radius[i] + radius[j]) / r)**6
+        E = E_c + eps * (s6**2 - 2 * s6)
+        dE = (-E_c + 12 * eps * (s6 - s6**2)) / r
+        d2E = (2 * E_c + eps * (156 * s6**2 - 84 * s6)) / r**2
+
+        # Pair block of d2E/dx_i dx_i; the i-j block is its opposite
+        uu = u[:, :, None] * u[:, None, :]
+        M = d2E[:, None, None] * uu + (dE / r)[:, None, None] * (np.eye(3) - uu)
+        energy += E.sum()
+        atoms = np.concatenate((i, j))
+        f = (dE[:, None] * u).T
+        grad += np.stack([np.bincount(atoms, np.concatenate((x, -x)), N_atoms) for x in f], axis=1)
+        m = M.reshape(-1, 9).T
+        diag += np.stack([np.bincount(atoms, np.concatenate((x, x)), N_atoms) for x in m], axis=1).reshape(-1, 3, 3)
+        ci = 3 * i[:, None] + np.arange(3)
+        cj = 3 * j[:, None] + np.arange(3)
+        hess[ci[:, :, None], cj[:, None, :]] = -M                 # Pairs are unique
+        hess[cj[:, :, None], ci[:, None, :]] = -M.transpose(0, 2, 1)
+    for n in range(N_atoms):
+        hess[3 * n:3 * n + 3, 3 * n:3 * n + 3] = diag[n]
+    return energy / HARTREE, grad.ravel() * BOHR / HARTREE, hess * BOHR**2 / HARTREE
+
+def pair_params(atom_types, charges, bond_idx, params):
+    """
+    All pairs i < j with a non zero scale factor and their
+    scaled q_i q_j (kcal/mol Ang), R_ij^6 and eps_ij
+    """
+    N_atoms = len(atom_types)
+    charges, radius, depth, scale_v, scale_c = nonbonded_params(atom_types, charges, params)
+    i, j = np.triu_indices(N_atoms, k=1)
+    i, j, sv, sc = scaled_pairs(i, j, special_pairs(bond_idx, N_atoms), scale_v, scale_c, N_atoms)
+    return (i, j, HARTREE * BOHR * sc * charges[i] * charges[j],
+            (radius[i] + radius[j])**6, sv * depth[i] * depth[j])
+
+def nonbonded_energies(frames, atom_types, charges, bond_idx, params, chunk=1 << 16):
+    """
+    Coulomb and VDW energies (Hartree) of each frame of
+    frames (n_frames, N, 3), Ang; the pair list is built once
+    and evaluated for all frames together, chunk pair-frames
+    at a time
+    """
+    frames = np.asarray(frames, dtype=float)
+    n_frames = len(frames)
+    i, j, qq, R6, eps = pair_params(atom_types, charges, bond_idx, params)
+
+    coulomb, vdw = np.zeros(n_frames), np.zeros(n_frames)
+    step = max(1, chunk // max(n_frames, 1))
+    for start in range(0, len(i), step):
+        sl = slice(start, start + step)
+        r = np.linalg.norm(frames[:, i[sl]] - frames[:, j[sl]], axis=2)     # (n_frames, pairs)
+        s6 = R6[sl] / r**6
+        coulomb += (qq[sl] / r).sum(axis=1)
+        vdw += (eps[sl] * (s6**2 - 2 * s6)).sum(axis=1)
+    return coulomb / HARTREE, vdw / HARTREE
+
+def frame_energies(frames, atom_types, charges, bond_idx, params):
+    """
+    MM energy of each frame (Hartree) by function class, as in
+    the 'Energy per function class' of Gaussian; 'Total' is the
+    Energy= value
+    """
+    coulomb, vdw = nonbonded_energies(frames, atom_types, charges, bond_idx, params)
+    stretch, bend, tors = bonded_energies(frames, atom_types, bond_idx, params)
+    return {'Coulomb': coulomb, 'Vanderwaals': vdw, 'Stretching': stretch,
+            'Bending': bend, 'Torsion': tors, 'Total': coulomb + vdw + stretch + bend + tors}
+
+
+class MMModel:
+    """
+    AMBER terms of a molecule with their parameters matched
+    once, bonded terms and scaled nonbonded pairs, for the
+    energy and gradient of many geometries (relaxations)
+    """
+
+    def __init__(self, atom_types, charges, bond_idx, params):
+        self.N_atoms = len(atom_types)
+        self.terms = bonded_params(atom_types, bond_idx, params)
+        self.i, self.j, self.qq, self.R6, self.eps = pair_params(atom_types, charges, bond_idx, params)
+
+    def energy_gradient(self, coords):
+        """
+        Energy (Hartree) and Cartesian gradient (Hartree/Bohr, 3N)
+        of coords (N, 3), Ang; the Total of frame_energies
+        """
+        coords = np.asarray(coords, dtype=float).reshape(self.N_atoms, 3)
+        q = wb.ric_values(coords, *[idx for idx, _ in self.terms])
+        terms = [(idx, x, p) for (idx, p), x in zip(self.terms, q)]
+        energy, grad = 0.0, np.zeros(coords.size)
+        for (idx, _, _), (E, dE, _), func in zip(terms, energy_derivatives(terms), wb.ROW_FUNCS):
+            if len(idx):
+                energy += E.sum()
+                d = dE[:, None] * func(coords, idx).reshape(len(idx), -1)
+                grad += np.bincount(wb.local_columns(idx).ravel(), d.ravel(), coords.size)
+
+        i, j = self.i, self.j
+        d = coords[i] - coords[j]
+        r = np.linalg.norm(d, axis=1)
+        s6 = self.R6 / r**6
+        E_c = self.qq / r
+        energy += (E_c + self.eps * (s6**2 - 2 * s6)).sum()
+        f = ((-E_c + 12 * self.eps * (s6 - s6**2)) / r**2)[:, None] * d
+        grad += np.stack([np.bincount(i, x, self.N_atoms) - np.bincount(j, x, self.N_atoms)
+                          for x in f.T], axis=1).ravel()
+        return energy / HARTREE, grad * BOHR / HARTREE
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 
+from bisect import bisect_right
 import numpy as np
+from term_table import TermTypes
 np.seterr(divide='ignore', invalid='ignore')
 
 def get_one_hot(values, indexes):
-    one_hot = np.eye(np.max(indexes) + 1)[indexes]
-    counts = np.sum(one_hot, axis=0)
-    average = np.sum((one_hot.T * values), axis=1) / counts
+    """ 
+    Mean of values per group index (ascending), 
+    empty groups dropped; bincount instead of a
+    dense one-hot matrix
+    """
+    indexes = np.asarray(indexes)
+    sums = np.bincount(indexes, weights=np.asarray(values, dtype=float))
+    counts = np.bincount(indexes)
+    average = sums / counts
     average = average[~np.isnan(average)]             # Remove NaN 
     return average
 
@@ -19,25 +27,46 @@ def reduce_bond_list(bond_list):
     return reduced
 
 def make_list_unique(var_list, k_values):
-    splitted = [ i.split() for i in var_list]
+    """ 
+    Merge each type with its first later mirror ("A B" / "B A")
+    and average k_values over the merged entries. Positions are 
+    hashed by type, so each lookup is a bisect instead of a scan;
+    var_list: TermTypes or type strings
+    """
+    if isinstance(var_list, TermTypes):                # Type ids, no strings
+        splitted = var_list.ids.tolist()
+    else:
+        splitted = [ i.split() for i in var_list]
     indexes = [i for i in range(len(splitted))]
+    positions = {}
+    for n, item in enumerate(splitted):
+        positions.setdefault(tuple(item), []).append(n)
     # Get indexes to be removed
     id2del = list()
-    for i in range(len(splitted[:])-1):
-        for j in range(i+1,len(splitted[:])):
-            if (splitted[i] == splitted[j][::-1]) and (i !=j) :
-                id2del.append(j)
-                indexes[j] = indexes[i]
-                break
+    for i in range(len(splitted)-1):
+        later = positions.get(tuple(splitted[i][::-1]))
+        if later is None:
+            continue
+        n = bisect_right(later, i)
+        if n < len(later):
+            j = later[n]
+            id2del.append(j)
+            indexes[j] = indexes[i]
 
     # pop indexes out; change res_bonds name 
     if len(id2del) != 0:
-        j = id2del[0]
-        res_bonds = splitted.copy()
-        for n in range(len(id2del)):
-            j = id2del[n] - n
-            res_bonds.pop(j)
-        reduced = list(' '.join(item) for item in res_bonds)
+        if all(a < b for a, b in zip(id2del, id2del[1:])):
+            dels = set(id2del)
+            res_bonds = [item for n, item in enumerate(splitted) if n not in dels]
+        else:                                           # Repeated hits: same pops as ever
+            res_bonds = splitted.copy()
+            for n in range(len(id2del)):
+                j = id2del[n] - n
+                res_bonds.pop(j)
+        if isinstance(var_list, TermTypes):
+            reduced = TermTypes(var_list.table, np.array(res_bonds).reshape(-1, var_list.ids.shape[1]))
+        else:
+            reduced = list(' '.join(item) for item in res_bonds)
     
         indexes = np.array(indexes)
         k_values_ave = get_one_hot(k_values, indexes)
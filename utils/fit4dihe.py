@@ -4,7 +4,6 @@ import argparse
 import numpy as np
 from numpy.linalg import inv
 from scipy import optimize
-import matplotlib.pyplot as plt
 
 
 def build_parser():
@@ -213,6 +212,7 @@ def main():
 
     # # PLOT DATA
     if args.plot:
+       import matplotlib.pyplot as plt              # Only needed to plot
        fig = plt.subplots(1, figsize= (10,8), dpi=96 )
        plt.plot(xval, qm_rel, label='QM', marker='o', markersize=8, fillstyle='none', c='black', linestyle='dashed', dashes=(5, 10))
        plt.plot(xval, mm_rel, label='MM', marker='o', markersize=8, fillstyle='none', c='orangered', linestyle='dashed', dashes=(5, 10))
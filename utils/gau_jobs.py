@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MODRED_WIDTH = {'X': 1, 'B': 2, 'A': 3, 'D': 4, 'L': 4}
+
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='gau_jobs.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('filelist', nargs='+', help='Gaussian input files')
+    parser.add_argument('-n', '--cpu-budget', type=int, default=os.cpu_count(), help='cores for all jobs')
+    parser.add_argument('--exe', help='Gaussian executable; default = $g09root/g09/g09')
+    parser.add_argument('--cache', default=default_cache_dir(),
+                        help='result cache directory; default = $SMARTFIELD_CACHE, else no cache')
+    parser.add_argument('--cache-size', type=float, default=2048, help='result cache size (MB)')
+    parser.add_argument('--state', help='job state file (resume)')
+    return parser
+
+def gaussian_exe(json_opts):
+    """
+    Gaussian executable: "gaussian_exe" of the json file (e.g.
+    a stand-in script for tests), else $g09root/g09/g09
+    """
+    exe = json_opts.get('gaussian_exe')
+    if exe:
+        return exe
+    return os.path.join(os.environ.get('g09root', ''), 'g09', 'g09')
+
+def read_gjf_info(fname):
+    """
+    %nprocshared, number of atoms and number of points
+    (scan steps + 1, 1 for a single point) of a Gaussian input
+    """
+    with open(fname, 'r') as f:
+        lines = f.read().splitlines()
+    nprocs = 1
+    for line in lines:
+        m = re.match(r'%nprocshared=(\d+)', line.strip(), re.IGNORECASE)
+        if m:
+            nprocs = int(m.group(1))
+    blank = [i for i, line in enumerate(lines) if not line.strip()]
+    route = next((i for i, line in enumerate(lines) if line.startswith('#')), 0)
+    blank = [i for i in blank if i > route]
+    n_atoms = blank[2] - blank[1] - 2 if len(blank) > 2 else 0  # Skip charge/multiplicity
+    points = 1
+    for line in lines[blank[2]:] if len(blank) > 2 else []:
+        x = line.split()                                            # ModRedundant: D i j k l S n step
+        w = MODRED_WIDTH.get(x[0], 0) if x else 0
+        if w and len(x) > w + 2 and x[w + 1] == 'S':
+            points *= int(x[w + 2]) + 1
+    return nprocs, n_atoms, points
+
+def expected_cost(fname):
+    """
+    Relative expected run time of a Gaussian input: points
+    x atoms^3 over its cores
+    """
+    nprocs, n_atoms, points = read_gjf_info(fname)
+    return points * max(n_atoms, 1)**3 / nprocs
+
+def log_file(fname):
+    """
+    Log written by Gaussian for the input fname
+    """
+    return os.path.splitext(fname)[0] + '.log'
+
+def input_hash(fname):
+    """
+    sha256 of the input file content
+    """
+    with open(fname, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def normal_termination(log):
+    """
+    True if the last line of the log is Gaussian's 'Normal
+    termination'; False if missing, truncated or failed
+    """
+    if not os.path.exists(log):
+        return False
+    with open(log, 'rb') as f:
+        f.seek(max(0, os.path.getsize(log) - 4096))
+        tail = f.read().decode(errors='replace').strip().splitlines()
+    return bool(tail) and 'Normal termination' in tail[-1]
+
+
+class JobState:
+    """
+    Persisted state of Gaussian jobs by input file: input hash,
+    status (queued, running, done, failed), exit code, log and
+    its Normal termination; rewritten at every change, so that
+    a restart redoes only the jobs that were not done
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.jobs = {}
+        self.lock = threading.Lock()                                # Updated from the job threads
+        if os.path.exists(fname):
+            with open(fname, 'r') as f:
+                self.jobs = json.load(f)
+
+    def save(self):
+        tmp = self.fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.jobs, f, indent=1)
+        os.replace(tmp, self.fname)                                 # Never a half written state
+
+    def update(self, fname, save=True, **fields):
+        with self.lock:
+            self.jobs.setdefault(fname, {}).update(fields)
+            if save:
+                self.save()
+
+    def is_done(self, fname):
+        """
+        Done with the same input and its log still ends normally;
+        a log of a run before the state file is taken as done
+        """
+        digest = input_hash(fname)
+        rec = self.jobs.get(fname)
+        if rec is not None and (rec['input_hash'] != digest or rec['status'] != 'done'):
+            return False
+        if not normal_termination(log_file(fname)):
+            return False
+        if rec is None:
+            self.update(fname, input_hash=digest, status='done', returncode=None,
+                        output=log_file(fname), normal_termination=True)
+        return True
+
+
+def chk_file(fname):
+    """
+    %chk file of the input fname (next to it), None if none
+    """
+    with open(fname, 'r') as f:
+        for line in f:
+            if line.lower().startswith('%chk='):
+                return os.path.join(os.path.dirname(fname), line.strip()[5:])
+    return None
+
+def normalize_token(x):
+    try:
+        return f'{float(x):.6f}'
+    except ValueError:
+        return x
+
+def normalized_input(fname):
+    """
+    Input as far as the results depend on it: no Link0 (%mem,
+    %nprocshared, %chk) and title lines, route in lower case,
+    '!' comments dropped, numbers in one format
+    """
+    with open(fname, 'r') as f:
+        lines = [line.split('!')[0].split() for line in f
+                 if not line.startswith('%') and not line.lstrip().startswith('!')]
+    route = next((i for i, x in enumerate(lines) if x and x[0].startswith('#')), 0)
+    end = next((i for i in range(route, len(lines)) if not lines[i]), len(lines))
+    title = next((i for i in range(end + 1, len(lines)) if not lines[i]), len(lines))
+    body = [' '.join(normalize_token(t) for t in x) for x in lines[title + 1:]]
+    while body and not body[-1]:
+        body.pop()
+    return '\n'.join([' '.join(sum(lines[route:end], [])).lower()] + body) + '\n'
+
+def program_id(exe):
+    """
+    Identity of the program behind exe (found on $PATH if
+    not a path): real path, size and mtime, so that another
+    Gaussian, an update or a stand-in script gets other keys
+    """
+    path = os.path.realpath(shutil.which(exe) or exe)
+    if not os.path.exists(path):
+        return path
+    stat = os.stat(path)
+    return f'{path} {stat.st_size} {stat.st_mtime_ns}'
+
+def cache_key(fname, program=''):
+    """
+    sha256 of the program identity and the normalized input
+    """
+    return hashlib.sha256((program + '\n' + normalized_input(fname)).encode()).hexdigest()
+
+def default_cache_dir():
+    """
+    $SMARTFIELD_CACHE, '' (no cache) if unset
+    """
+    return os.environ.get('SMARTFIELD_CACHE', '')
+
+
+class ResultCache:
+    """
+    Content addressed store of Gaussian results (log and chk)
+    by the normalized hash of their input and of the program
+    exe that computes them, shared by runs and molecules;
+    beyond max_bytes the least recently used entries
+    (directory mtime) are evicted. Hits and misses are counted
+    for this run and, in stats.json, for the cache
+    """
+
+    def __init__(self, root, exe, max_bytes=2 << 30):
+        self.root = root
+        self.program = program_id(exe)
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self.saved = (0, 0)
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, fname):
+        """
+        Copy the cached log (and chk) of the input fname to
+        where Gaussian would write them; True on a hit
+        """
+        path = self.entry(cache_key(fname, self.program))
+        hit = normal_termination(os.path.join(path, 'output.log'))
+        if hit:
+            shutil.copyfile(os.path.join(path, 'output.log'), log_file(fname))
+            chk = chk_file(fname)
+            if chk and os.path.exists(os.path.join(path, 'output.chk')):
+                shutil.copyfile(os.path.join(path, 'output.chk'), chk)
+            os.utime(path)                                          # Most recently used
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+
+    def store(self, fname):
+        """
+        Add the results of a normally terminated job of fname
+        """
+        if not normal_termination(log_file(fname)):
+            return
+        path = self.entry(cache_key(fname, self.program))
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        shutil.copyfile(log_file(fname), os.path.join(tmp, 'output.log'))
+        chk = chk_file(fname)
+        if chk and os.path.exists(chk):
+            shutil.copyfile(chk, os.path.join(tmp, 'output.chk'))
+        try:
+            os.replace(tmp, path)                                   # Readers never see a partial entry
+        except OSError:                                             # Stored meanwhile by another job
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for sub in os.scandir(self.root):
+                if not sub.is_dir():
+                    continue
+                for d in os.scandir(sub.path):
+                    if d.is_dir() and not d.name.endswith('.tmp'):
+                        size = sum(f.stat().st_size for f in os.scandir(d.path))
+                        entries.append((d.stat().st_mtime, size, d.path))
+            total = sum(x[1] for x in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def save_stats(self):
+        """
+        Add the counts since the last save to stats.json
+        """
+        fname = os.path.join(self.root, 'stats.json')
+        stats = {'hits': 0, 'misses': 0}
+        if os.path.exists(fname):
+            with open(fname, 'r') as f:
+                stats.update(json.load(f))
+        stats['hits'] += self.hits - self.saved[0]
+        stats['misses'] += self.misses - self.saved[1]
+        self.saved = (self.hits, self.misses)
+        tmp = f'{fname}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp, fname)
+        return stats
+
+def open_cache(json_opts):
+    """
+    ResultCache of "cache_dir" (default $SMARTFIELD_CACHE, None
+    if neither is set) and "cache_size" (MB), keyed by the
+    Gaussian executable of json_opts
+    """
+    root = json_opts.get('cache_dir', default_cache_dir())
+    if not root:
+        return None
+    return ResultCache(root, gaussian_exe(json_opts), int(float(json_opts.get('cache_size', 2048)) * 2**20))
+
+
+def run_job(exe, fname, state=None):
+    """
+    One Gaussian run of fname in its directory; return code,
+    stdout, stderr and wall time (s)
+    """
+    if state is not None:
+        state.update(fname, status='running')
+    t0 = time.perf_counter()
+    try:
+        process = subprocess.run([exe, os.path.basename(fname)], cwd=os.path.dirname(fname) or None,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        res = {'returncode': process.returncode, 'stdout': process.stdout.decode(errors='replace'),
+               'stderr': process.stderr.decode(errors='replace')}
+    except OSError as err:                                          # Missing executable
+        res = {'returncode': -1, 'stdout': '', 'stderr': str(err)}
+    res.update(fname=fname, wall=time.perf_counter() - t0)
+    return res
+
+def run_jobs(exe, file_list, cpu_budget=None, label='Gaussian', state=None, cache=None):
+    """
+    Run the Gaussian inputs of file_list keeping as many jobs in
+    flight as the cpu_budget (default all cores) allows for
+    their %nprocshared, the longest expected first; per job
+    report on completion. With a JobState, the jobs done are
+    skipped and every job is recorded as it starts and ends.
+    With a ResultCache, the results of inputs already computed
+    are copied from it, and the new ones added to it.
+    Results of the jobs run or taken from the cache, in
+    file_list order
+    """
+    if state is not None:
+        done = [f for f in file_list if state.is_done(f)]
+        for f in done:
+            print(f"{label} on {f} already done ({log_file(f)}).")
+        file_list = [f for f in file_list if f not in done]
+    results = {}
+    if cache is not None:
+        for f in file_list:
+            if cache.fetch(f):
+                print(f"{label} on {f} taken from the cache ({log_file(f)}).")
+                results[f] = {'fname': f, 'returncode': 0, 'stdout': '', 'stderr': '', 'wall': 0.0,
+                              'normal_termination': True, 'cached': True}
+                if state is not None:
+                    state.update(f, save=False, input_hash=input_hash(f), status='done', returncode=0,
+                                 output=log_file(f), normal_termination=True, cached=True)
+        cache.save_stats()
+    run_list = [f for f in file_list if f not in results]
+    if state is not None:
+        for f in run_list:
+            state.update(f, save=False, input_hash=input_hash(f), status='queued', returncode=None,
+                         output=log_file(f), normal_termination=False)
+        state.save()
+    if not run_list:
+        return [results[f] for f in file_list]
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    cores = max(read_gjf_info(f)[0] for f in run_list)
+    n_jobs = max(1, min(len(run_list), cpu_budget // cores))
+    order = sorted(run_list, key=expected_cost, reverse=True)
+    print(f"Running {len(run_list)} {label} jobs, {n_jobs} at a time ({cores} cores each)")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:         # Jobs start in submission order
+        futures = [pool.submit(run_job, exe, f, state) for f in order]
+        for future in as_completed(futures):
+            res = future.result()
+            results[res['fname']] = res
+            res['normal_termination'] = normal_termination(log_file(res['fname']))
+            if state is not None:
+                ok = res['returncode'] == 0 and res['normal_termination']
+                state.update(res['fname'], status='done' if ok else 'failed', returncode=res['returncode'],
+                             normal_termination=res['normal_termination'], wall=round(res['wall'], 3))
+            if cache is not None and res['returncode'] == 0:
+                cache.store(res['fname'])
+            if res['returncode'] != 0:
+                print(f"Error executing {label} on {res['fname']}. Details: {res['stderr'].strip()}")
+            elif not res['normal_termination']:
+                print(f"Error executing {label} on {res['fname']}: no Normal termination in {log_file(res['fname'])}")
+            else:
+                print(f"{label} executed successfully on {res['fname']} ({res['wall']:.1f} s)")
+    if cache is not None:
+        cache.evict()
+    n_failed = len(failed_jobs(results[f] for f in run_list))
+    print(f"{len(run_list)} {label} jobs in {time.perf_counter() - t0:.1f} s: "
+          f"{len(run_list) - n_failed} succeeded, {n_failed} failed\n")
+    return [results[f] for f in file_list]
+
+def failed_jobs(results):
+    """
+    Inputs of the run_jobs results with a non zero exit code
+    or no Normal termination
+    """
+    return [res['fname'] for res in results if res['returncode'] != 0 or not res['normal_termination']]
+
+def main():
+    """
+    Run Gaussian inputs concurrently through the result cache
+    """
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    json_opts = {'gaussian_exe': opts.exe, 'cache_dir': opts.cache, 'cache_size': opts.cache_size}
+    cache = open_cache(json_opts)
+    state = JobState(opts.state) if opts.state else None
+    results = run_jobs(gaussian_exe(json_opts), opts.filelist, opts.cpu_budget, state=state, cache=cache)
+    if cache is not None:
+        print(f"Result cache {cache.root}: {cache.hits} hits, {cache.misses} misses")
+    return 1 if failed_jobs(results) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+def as_index(idx, n):
+    """
+    Integer (n_terms, n) array of zero based atom indexes
+    """
+    return np.asarray(idx, dtype=int).reshape(-1, n)
+
+class InternalCoordinates:
+    """
+    Bond lengths, angles and dihedrals of a geometry,
+    each kind in one vectorized pass over index arrays
+    (n_bonds, 2), (n_angles, 3), (n_dihedrals, 4), zero based
+    """
+
+    def __init__(self, coords):
+        self.coords = np.asarray(coords, dtype=float)
+
+    def bonds(self, idx):
+        idx = as_index(idx, 2)
+        diff_AB = self.coords[idx[:, 0]] - self.coords[idx[:, 1]]
+        return np.linalg.norm(diff_AB, axis=1)
+
+    def angles(self, idx):
+        """
+        A-B-C angles in degrees
+        """
+        idx = as_index(idx, 3)
+        diff_AB = self.coords[idx[:, 0]] - self.coords[idx[:, 1]]
+        diff_BC = self.coords[idx[:, 1]] - self.coords[idx[:, 2]]
+        u_AB = diff_AB / np.linalg.norm(diff_AB, axis=1)[:, None]
+        u_BC = diff_BC / np.linalg.norm(diff_BC, axis=1)[:, None]
+        cos_theta = np.clip(np.einsum('ij,ij->i', u_AB, u_BC), -1.0, 1.0)
+        return 180 - np.arccos(cos_theta) * 180 / np.pi
+
+    def dihedrals(self, idx, signed=False):
+        """
+        A-B-C-D dihedrals in degrees from atan2, i.e. well defined
+        near 0 and 180; in [0, 180] unless signed (-180, 180]
+        """
+        idx = as_index(idx, 4)
+        diff_AB = self.coords[idx[:, 0]] - self.coords[idx[:, 1]]
+        diff_BC = self.coords[idx[:, 1]] - self.coords[idx[:, 2]]
+        diff_CD = self.coords[idx[:, 2]] - self.coords[idx[:, 3]]
+        u_ABC = np.cross(diff_AB, diff_BC)
+        u_BCD = np.cross(diff_BC, diff_CD)
+        u_BC = diff_BC / np.linalg.norm(diff_BC, axis=1)[:, None]
+        x = np.einsum('ij,ij->i', u_ABC, u_BCD)
+        y = np.einsum('ij,ij->i', np.cross(u_ABC, u_BC), u_BCD)
+        phi = np.arctan2(y, x) * 180 / np.pi
+        return phi if signed else np.abs(phi)
+
+    def compute(self, bonds=(), angles=(), dihedrals=()):
+        return self.bonds(bonds), self.angles(angles), self.dihedrals(dihedrals)
@@ -2,8 +2,7 @@
 
 
 import argparse
-import numpy as np
-import pandas as pd
+import scan_extract
 
 # def read_gjf(file_gjf):
 #     match = "Variables"
@@ -29,7 +28,7 @@ def build_parser():
     Build options for parser
     """
     parser = argparse.ArgumentParser()
-    txt = 'The type of file to be opened: qm or mm'
+    txt = 'ignored, kept for compatibility: qm (ModRedundant) or mm (z-matrix) scans are detected from the log'
     parser.add_argument('-t', type=str, default='qm',
                          help=txt)
     txt = "Scan log file"
@@ -39,70 +38,15 @@ def build_parser():
 
 
 def read_log(file_log, ftype):
-     line_0 = []
-     line_1 = []
-     splitted_line = []
-     match_0 = " The following ModRedundant input section has been read:"
-     match_01 = "       Variables:"
-     match_1 = " Summary of Optimized Potential Surface Scan"
-     match_2 = "Eigenvalues"
-     match_3 = " ! Name  Definition              Value          Derivative Info."
-     match_4 = " ---"
-
-     # Get Angle step size:
-     # If file QM.log search for match_0
-     #
-     with open(file_log, 'r' ) as f:
-        if ftype == 'qm':                            # If log file QM
-            for line in f:
-                 if line[:56] == match_0:
-                     break
-            line_0.append(f.readline().split())
-            step_ang = float(line_0[0][7])
-    
-           # Get Starting Angle
-            for line in f:
-                if line[:64] == match_3:
-                    break
-            f.readline()
-            for line in f:
-                if line[:4] == match_4:
-                    break
-                line_1.append(line.split())
-            for i, x in enumerate(line_1):
-                if len(x) == 6:
-                    angle = float(x[3])
-        else:                                   # If log file MM
-            for line in f:
-                if line[:17] == match_01:
-                     break
-            for line in f:
-                if line == " \n":
-                    break
-                line_0.append(line.split())
-            for i in line_0:
-                if len(i) == 5:
-                   angle = float(i[1])
-                   step_ang = float(i[4])
-            # print(angle, step_ang)
-
-        # Get Energies
-        for line in f:
-            if line[:44] == match_1:
-                ipos = line.find('to')
-                add = float(line[50:ipos])
-                for line in f:
-                    ipos = line.find(match_2)
-                    if line[ipos:16] == match_2:
-                        splitted_line.append(line.split())
-     f.close()   
-
-     energy_list = []
-     [ energy_list.append(list(map(float,i[2:]))) for i in splitted_line ] 
-     energy = [ y for x in energy_list for y in x]
-     energy = np.array(energy)
-     energy = energy + add
-     return step_ang, angle, energy
+     """
+     Step, starting angle and energies of a QM (ModRedundant)
+     or MM (z-matrix) scan log; the type is detected by
+     scan_extract.read_scan, ftype is kept for compatibility
+     """
+     res = scan_extract.read_scan(file_log)
+     if 'step' not in res:
+         raise ValueError(f'No relaxed scan ({ftype}) in {file_log}')
+     return res['step'], res['start'], res['energy']
 
 def main():
     parser = build_parser()
@@ -118,11 +62,10 @@ def main():
         ang = ang + size_step
         phi.append(ang)
     
-    energy = list(energy_au)
-    df = pd.DataFrame([phi, energy]).T
-    # df = pd.DataFrame([phi, energy_au], columns=['Angle', 'Energy'])
-    df.to_csv(fout)
-
+    with open(fout, 'w') as fopen:
+        fopen.write(',0,1\n')
+        for i, (x, y) in enumerate(zip(phi, energy_au)):
+            fopen.write(f'{i},{x!r},{float(y)!r}\n')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
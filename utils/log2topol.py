@@ -91,6 +91,17 @@ def print_topol(*args):
         fout.write(f'{len(tl)}\n')
         for i in tl:
             fout.write(f' {i[0]} {i[1]} {i[2]} {i[3]}\n')
+
+def read_topol(fname):
+    """ 
+    Bond, angle and torsion lists (1 based) of a topol.txt file
+    """
+    lists = []
+    with open(fname, 'r') as f:
+        for _ in range(3):
+            n = int(f.readline().split()[0])
+            lists.append([list(map(int, f.readline().split())) for _ in range(n)])
+    return lists
             
             
 
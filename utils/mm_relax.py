@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import amber_mm as amm
+import wilson_b as wb
+
+
+def dihedral_value(x, dihe):
+    """
+    Signed dihedral (radians) of the zero based atoms dihe
+    in the flat coordinates x (Ang)
+    """
+    return wb.ric_values(x.reshape(-1, 3), dihe_idx=dihe[None])[2][0]
+
+def dihedral_row(x, dihe):
+    """
+    dphi/dx (3N, rad/Ang) of the dihedral dihe
+    """
+    b = np.zeros((len(x) // 3, 3))
+    b[dihe] = wb.dihedral_rows(x.reshape(-1, 3), dihe[None])[0]
+    return b.ravel()
+
+def project(v, b):
+    """
+    v without its component along b
+    """
+    return v - (v @ b) / (b @ b) * b
+
+def hold_dihedral(x, dihe, phi0, tol=1e-10, max_iter=50):
+    """
+    Newton steps along dphi/dx back to phi0 (as SHAKE does
+    for bonds); the smallest displacement that restores it
+    """
+    for _ in range(max_iter):
+        dphi = (phi0 - dihedral_value(x, dihe) + np.pi) % (2 * np.pi) - np.pi
+        if abs(dphi) < tol:
+            break
+        b = dihedral_row(x, dihe)
+        x = x + dphi / (b @ b) * b
+    return x
+
+def lbfgs_direction(g, S, Y):
+    """
+    -H g by the L-BFGS two loop recursion over the stored
+    steps S and gradient changes Y
+    """
+    q = g.copy()
+    alpha = []
+    for s, y in zip(reversed(S), reversed(Y)):
+        a = (s @ q) / (y @ s)
+        q -= a * y
+        alpha.append(a)
+    q *= (S[-1] @ Y[-1]) / (Y[-1] @ Y[-1])
+    for (s, y), a in zip(zip(S, Y), reversed(alpha)):
+        q += (a - (y @ q) / (y @ s)) * s
+    return -q
+
+def relax(model, coords, dihe, gtol=1e-6, max_iter=1000, memory=10, max_step=0.2):
+    """
+    L-BFGS minimization over Cartesian coordinates (Ang) of
+    the MMModel energy with the dihedral dihe (zero based) held
+    at its starting value, as in a Gaussian ModRedundant scan
+    point: the gradient and the steps are projected off dphi/dx
+    and every trial point is put back on the constraint.
+    Converged when the largest projected force is below gtol
+    (Hartree/Bohr). Returns energy (Hartree), coords, converged
+    """
+    dihe = np.asarray(dihe, dtype=int)
+    x = np.asarray(coords, dtype=float).ravel().copy()
+    phi0 = dihedral_value(x, dihe)
+    energy, grad = model.energy_gradient(x)
+    g = project(grad / amm.BOHR, dihedral_row(x, dihe))        # Hartree/Ang
+    S, Y = [], []
+    converged = False
+    for _ in range(max_iter):
+        if np.abs(g).max() * amm.BOHR < gtol:
+            converged = True
+            break
+        b = dihedral_row(x, dihe)
+        d = project(lbfgs_direction(g, S, Y), b) if S else -g
+        if d @ g >= 0:                                          # Not a descent direction
+            S, Y = [], []
+            d = -g
+        step = np.linalg.norm(d.reshape(-1, 3), axis=1).max()
+        t = min(1.0, max_step / step) if S else min(max_step, 0.05) / step
+        for _ in range(30):                                     # Backtracking (Armijo)
+            x_new = hold_dihedral(x + t * d, dihe, phi0)
+            energy_new, grad = model.energy_gradient(x_new)
+            if energy_new <= energy + 1e-4 * t * (d @ g):
+                break
+            t *= 0.5
+        else:
+            break                                               # No decrease left
+        g_new = project(grad / amm.BOHR, dihedral_row(x_new, dihe))
+        s, y = x_new - x, g_new - g
+        if s @ y > 1e-12:
+            S.append(s)
+            Y.append(y)
+            S, Y = S[-memory:], Y[-memory:]
+        x, energy, g = x_new, energy_new, g_new
+    return energy, x.reshape(-1, 3), converged
+
+def relax_frames(model, frames, dihe, nprocs=1, **opts):
+    """
+    relax over the frames (n_frames, N, 3) of a scan, through
+    a process pool if nprocs > 1; energies (Hartree), relaxed
+    frames and the converged flags, in frame order
+    """
+    func = partial(relax, model, dihe=dihe, **opts)
+    if nprocs <= 1 or len(frames) < 2:
+        results = [func(x) for x in frames]
+    else:
+        with ProcessPoolExecutor(max_workers=nprocs) as pool:
+            results = list(pool.map(func, frames))
+    if not results:
+        return np.zeros(0), np.zeros((0,) + np.shape(frames)[1:]), np.zeros(0, dtype=bool)
+    energy, coords, converged = zip(*results)
+    return np.array(energy), np.array(coords), np.array(converged)
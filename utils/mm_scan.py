@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import numpy as np
+import amber_mm as amm
+import mm_relax
+import gauScan2com as scan2mm
+import log2topol
+import parse_cache as pcache
+import scan_extract
+
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='mm_scan.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('logfile', help='Gaussian QM relaxed scan log file')
+    parser.add_argument('-ff', default='ff_string.txt', help='force field section, ff_string.txt or SmartField4gau.gjf')
+    parser.add_argument('-t', '--types', default='type_charge.txt', help='atom type-charge file')
+    parser.add_argument('--topol', default='topol.txt', help='topology (bonds) file')
+    parser.add_argument('--silence', nargs=4, metavar='TYPE', help='torsion type whose barriers are set to 0.0')
+    parser.add_argument('--relax', action='store_true', help='relaxed MM energies, scanned dihedral held')
+    parser.add_argument('--dihedral', nargs=4, type=int, metavar='ATOM',
+                        help='held dihedral (1 based); default = the ModRedundant scan one')
+    parser.add_argument('-n', '--nprocs', type=int, default=1, help='worker processes of the relaxation')
+    parser.add_argument('--prm', help='amber.prm of the missing types; default = $g09root/g09/amber.prm')
+    parser.add_argument('-o', help='output file; default = <scan>_all.csv')
+    return parser
+
+def read_ff(fname):
+    """
+    Soft parameter records of a force field section file
+    or of the Amber input (.gjf) it was written to
+    """
+    if fname.endswith('.gjf'):
+        return amm.read_gjf(fname)[4]
+    with open(fname, 'r') as f:
+        return amm.soft_records(f)
+
+def read_type_charge(atype_chg):
+    """
+    Atom types and charges of the type_charge.txt lines
+    ('C0--0.267532', as read by read_txt_info)
+    """
+    fields = [item[0].split('-', 1) for item in atype_chg]
+    return [x[0] for x in fields], np.array([float(x[1]) for x in fields])
+
+def amber_prm_files(json_opts=None):
+    """
+    amber.prm files to look for, in order: "amber_prm" of the
+    json file (only that one if given), next to "gaussian_exe",
+    $g09root/g09/amber.prm
+    """
+    json_opts = json_opts or {}
+    if json_opts.get('amber_prm'):
+        return [json_opts['amber_prm']]
+    files = []
+    if json_opts.get('gaussian_exe'):
+        files.append(os.path.join(os.path.dirname(os.path.abspath(json_opts['gaussian_exe'])), 'amber.prm'))
+    files.append(os.path.join(os.environ.get('g09root', ''), 'g09', 'amber.prm'))
+    return files
+
+def amber_prm(files):
+    """
+    AmberParm of the first of files found, for the types missing
+    in the soft parameters (Amber=SoftFirst), None if none is
+    """
+    fname = next((f for f in files if os.path.exists(f)), None)
+    return pcache.open_prm(fname) if fname else None
+
+def mm_energies(frames, atom_types, charges, bond_idx, params, relax=False, dihedral=None, nprocs=1, label=''):
+    """
+    MM energies of the frames in one batch; with relax, each
+    frame is first MM minimized with the dihedral (1 based)
+    held, frames spread over nprocs processes
+    """
+    if not relax:
+        return amm.frame_energies(frames, atom_types, charges, bond_idx, params)['Total']
+    if dihedral is None:
+        raise ValueError(f'{label}: no scanned dihedral to hold')
+    model = amm.MMModel(atom_types, charges, bond_idx, params)
+    mm, _, converged = mm_relax.relax_frames(model, frames, np.array(dihedral) - 1, nprocs)
+    if not converged.all():
+        print(f'Warning: MM relaxation not converged for points {np.flatnonzero(~converged).tolist()} of {label}')
+    return mm
+
+def scan_energies(log_file, atom_types, charges, bond_idx, params, relax=False, dihedral=None, nprocs=1):
+    """
+    Scan angles, QM energies and MM energies of the optimized
+    points of a QM scan log, the MM of all frames in one batch;
+    empty if the scan has not finished. With relax, each frame
+    is first MM minimized with the scanned dihedral (1 based)
+    held, frames spread over nprocs processes
+    """
+    scan = scan_extract.read_scan(log_file)
+    if not len(scan['energy']):
+        return scan['phi'], scan['energy'], np.zeros(0)
+    elements, coords = scan2mm.read_log(log_file)
+    n = min(len(scan['energy']), len(coords))
+    mm = mm_energies(coords[:n], atom_types, charges, bond_idx, params, relax,
+                     dihedral or scan.get('dihedral'), nprocs, log_file)
+    return scan['phi'][:n], scan['energy'][:n], mm
+
+def write_all(fname, phi, qm, mm):
+    """
+    phi, QM and MM energies (Hartree) as read by fit4dihe
+    """
+    with open(fname, 'w') as fopen:
+        for x, y, z in zip(phi, qm, mm):
+            fopen.write(f'{float(x)!r}  {float(y)!r}  {float(z)!r}\n')
+
+def main():
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    records = read_ff(opts.ff)
+    if opts.silence:
+        records = amm.silence_torsion(records, opts.silence)
+    atom_types, charges = read_type_charge(scan2mm.read_txt_info(opts.types))
+    bond_idx = np.array(log2topol.read_topol(opts.topol)[0], dtype=int) - 1
+    prm_files = amber_prm_files({'amber_prm': opts.prm})
+    params = amm.SoftParams(records, amber_prm(prm_files), prm_files)
+    phi, qm, mm = scan_energies(opts.logfile, atom_types, charges, bond_idx, params,
+                                opts.relax, opts.dihedral, opts.nprocs)
+    fout = opts.o or os.path.splitext(opts.logfile)[0].replace('_qm', '') + '_all.csv'
+    write_all(fout, phi, qm, mm)
+
+if __name__ == "__main__":
+    main()
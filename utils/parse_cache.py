@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import numpy as np
+import parser_gau as pgau
+
+FCHK_SECTIONS = ('Current cartesian coordinates', 'Redundant internal dimensions',
+                 'Internal Forces', 'Internal Force Constants', 'Cartesian Force Constants',
+                 'Cartesian Gradient')
+
+
+def cache_name(fname):
+    """
+    Cache sidecar stored next to the input file
+    """
+    return fname + '.npz'
+
+def file_hash(fname):
+    sha = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def load_cache(fname):
+    """
+    Return the cached arrays of fname, or None if
+    missing or stale. The entry is valid if size matches
+    and either mtime or the content hash matches; on a
+    hash match the new mtime is stored, so the next run
+    does not hash the file again
+    """
+    fcache = cache_name(fname)
+    if not os.path.exists(fcache):
+        return None
+    stat = os.stat(fname)
+    try:
+        with np.load(fcache) as npz:
+            data = dict(npz)
+        if int(data['_size']) != stat.st_size:
+            return None
+        if int(data['_mtime']) != stat.st_mtime_ns:
+            digest = file_hash(fname)
+            if str(data['_hash']) != digest:
+                return None
+            arrays = {k: v for k, v in data.items() if not k.startswith('_')}
+            try:
+                save_cache(fname, arrays, digest)
+            except OSError:                                     # Read-only directory
+                pass
+    except (OSError, KeyError, ValueError):
+        return None
+    return data
+
+def save_cache(fname, arrays, digest=None):
+    """
+    Store arrays keyed by size, mtime and hash of fname
+    """
+    stat = os.stat(fname)
+    fcache = cache_name(fname)
+    ftmp = fcache + '.tmp.npz'
+    np.savez_compressed(ftmp, _size=stat.st_size, _mtime=stat.st_mtime_ns,
+                        _hash=digest or file_hash(fname), **arrays)
+    os.replace(ftmp, fcache)
+
+
+class CachedFchkFile:
+    """
+    FchkFile look-alike backed by a .npz sidecar:
+    on a warm run no text is parsed at all
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._arrays = {}
+        self._data = load_cache(fname)
+        if self._data is None:
+            fchk = pgau.FchkFile(fname)
+            arrays = {'Number of atoms': fchk.get_scalar('Number of atoms')}
+            for name in FCHK_SECTIONS:
+                if name in fchk:
+                    arrays[name] = fchk.get_array(name)
+            save_cache(fname, arrays)
+            self._data = arrays
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def get_scalar(self, name):
+        return np.asarray(self._data[name]).item()
+
+    def get_array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.asarray(self._data[name])
+        return self._arrays[name]
+
+    def get_ints(self, name):
+        return self.get_array(name).astype(int, copy=False)
+
+    def get_reals(self, name):
+        return self.get_array(name).astype(float, copy=False)
+
+
+def open_fchk(fname, cache=False):
+    if cache:
+        return CachedFchkFile(fname)
+    return pgau.FchkFile(fname)
+
+def open_prm(fname, cache=False):
+    """
+    AmberParm database of fname; with cache the parameter
+    lines are kept in the .npz sidecar (or not at all if
+    the directory is not writable)
+    """
+    data = load_cache(fname) if cache else None
+    if data is not None:
+        return pgau.AmberParm({kind: data[kind].tolist() for kind in pgau.PRM_KINDS})
+
+    records = pgau.read_prm(fname)
+    if cache:
+        try:
+            save_cache(fname, {kind: np.array(recs, dtype=str) for kind, recs in records.items()})
+        except OSError:
+            pass
+    return pgau.AmberParm(records)
+
+def read_log(fname, ric_list, N_atoms, cache=False):
+    """
+    CM5 charges and RIC topology of a Gaussian log file:
+    returns charges, bond_list, angle_list, dihe_list
+    """
+    data = load_cache(fname) if cache else None
+    if data is not None and list(data['ric_list']) == list(ric_list) \
+       and int(data['N_atoms']) == N_atoms:
+        return data['charge'].tolist(), data['bonds'].tolist(), \
+               data['angles'].tolist(), data['dihes'].tolist()
+
+    res = pgau.scan_log(pgau.iter_lines(fname), ric_tot=ric_list[0], N_atoms=N_atoms)
+    charge = res['charges']
+    bond_list, angle_list, dihe_list = pgau.ric2lists(res['ric'])
+    if cache:
+        save_cache(fname, {'ric_list': np.array(ric_list), 'N_atoms': N_atoms,
+                           'charge': np.array(charge, dtype=str),
+                           'bonds': np.array(bond_list, dtype=int).reshape(-1, 2),
+                           'angles': np.array(angle_list, dtype=int).reshape(-1, 3),
+                           'dihes': np.array(dihe_list, dtype=int).reshape(-1, 4)})
+    return charge, bond_list, angle_list, dihe_list
@@ -28,73 +28,102 @@ def store_any_file(fname):
 
     return all_lines
 
-def read_XYZ(all_lines):
+def decode_block(block, count, dtype=float):
     """ 
-    Reading CC XYZ from fchk file 
+    Decoding a whitespace separated block of numbers
+    into a 1D array of exactly count items (C speed)
     """
-    # with open(fname, 'r') as f:
-    #     all_lines = []
-    #     for line in f:
-    #         all_lines.append(line.strip())
-
-    for s in range(len(all_lines)):                          # Get no of Atoms
-        if 'Number of atoms' in all_lines[s]:
-            Natom = int(all_lines[s][-10:])  
-        
-    No_cc = 3* Natom
-    nlines = int(No_cc/5.0) + 1
-    cc_xyz_list = []
-    for s in range(len(all_lines)):                          #  Get CC Coordinates
-        if 'Current cartesian coordinates' in all_lines[s]:                              #Reads the Input orientation information
-            start = s
-            for e in range2(start + 1, start + nlines):
-                cc_xyz_list.append(all_lines[e].split() )
-    
-    cc_xyz_flat = flat_list(cc_xyz_list)
-
-    # Take out Garbage Strings
-    if len(cc_xyz_flat) != No_cc:
-        diff = abs(len(cc_xyz_flat) - No_cc)
-        cc_xyz_flat_mod = cc_xyz_flat[:-diff]
-        cc_xyz_1D = np.array(cc_xyz_flat_mod, float)
-    else:
-        cc_xyz_1D = np.array(cc_xyz_flat, float)
+    arr = np.fromstring(block, dtype=dtype, sep=' ')
+    if arr.size < count:
+        raise ValueError(f'Expected {count} values, found {arr.size}')
+    return arr[:count]
 
+class FchkFile:
+    """
+    Indexed Gaussian fchk file:
+    the file is read once to build an index
+    name -> (type, count, byte offset, byte length)
+    and the numbers of a section are decoded only
+    when asked for
+    """
+    per_line = {'I': 6, 'R': 5, 'C': 5, 'H': 9, 'L': 72}
+    dtypes = {'I': int, 'R': float}
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.index = {}
+        self._scalars = {}
+        self._arrays = {}
+        with open(fname, 'rb') as f:
+            offset = len(f.readline()) + len(f.readline())    # Title & job lines
+            line = f.readline()
+            while line:
+                offset += len(line)
+                name = line[:40].strip().decode()
+                typ = line[43:44].decode()
+                if line[47:49] == b'N=':                        # Array section
+                    count = int(line[49:])
+                    nbytes = 0
+                    for _ in range(-(-count // self.per_line[typ])):
+                        nbytes += len(f.readline())
+                    self.index[name] = (typ, count, offset, nbytes)
+                    offset += nbytes
+                elif name:                                      # Scalar section
+                    self.index[name] = (typ, 1, offset - len(line), len(line))
+                    self._scalars[name] = line[49:].strip().decode()
+                line = f.readline()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def _read_block(self, name):
+        _, _, offset, nbytes = self.index[name]
+        with open(self.fname, 'rb') as f:
+            f.seek(offset)
+            return f.read(nbytes)
+
+    def get_scalar(self, name):
+        """ 
+        Value of a scalar section, e.g. 'Number of atoms'
+        """
+        typ = self.index[name][0]
+        return self.dtypes.get(typ, str)(self._scalars[name])
+
+    def get_array(self, name):
+        """ 
+        Decoded 1D array of an I or R section
+        """
+        if name not in self._arrays:
+            typ, count, _, _ = self.index[name]
+            block = self._read_block(name)
+            self._arrays[name] = decode_block(block, count, self.dtypes[typ])
+        return self._arrays[name]
+
+    def get_ints(self, name):
+        return self.get_array(name).astype(int, copy=False)
+
+    def get_reals(self, name):
+        return self.get_array(name).astype(float, copy=False)
+
+
+def read_XYZ(fchk):
+    """ 
+    Reading CC XYZ from fchk file 
+    """
+    Natom = fchk.get_scalar('Number of atoms')
+    cc_xyz_1D = fchk.get_reals('Current cartesian coordinates')
     cc_xyz_arr = np.reshape(cc_xyz_1D, (Natom,3))
     cc_xyz_arr = cc_xyz_arr*0.529177                          # Convert from Bohr to Ang.
     
     return Natom, cc_xyz_arr
 
-def read_RicDim_Grad(all_lines):
+def read_RicDim_Grad(fchk):
     """ 
     Reading Redundant Internal Dimension &
     Gradient from fchk file 
     """
-
-    for s in range(len(all_lines)):                          # Get no of Atoms
-        if 'Redundant internal dimensions' in all_lines[s]:
-            tmp_list = all_lines[s+1].split()
-            ric_list = list(map(int,tmp_list))
-
-    force_list = []
-    for s in range(len(all_lines)):                          # Get no of Atoms
-        if 'Internal Forces' in all_lines[s]:
-            N_force = int(all_lines[s][-10:])
-            nlines = int(N_force/5.0) + 1
-            start = s
-            for e in range2(start + 1, start + nlines):
-                force_list.append(all_lines[e].split() )
-    
-    
-    force_flat = flat_list(force_list)
-
-    # Take out Garbage Strings
-    if len(force_flat) != N_force:
-        diff = abs(len(force_flat) - N_force)
-        force_flat_mod = force_flat[:-diff]
-        force_1D = np.array(force_flat_mod, float)
-    else:
-        force_1D = np.array(force_flat,float)
+    ric_list = list(map(int, fchk.get_ints('Redundant internal dimensions')))
+    force_1D = fchk.get_reals('Internal Forces')
 
     return ric_list, force_1D
 
@@ -111,97 +140,103 @@ def fill_lower_diag(a):
     out[mask] = a
     return out
 
-def read_HessRIC(all_lines, ric_list):
+class PackedSymmetricMatrix:
+    """
+    Symmetric matrix kept as the Gaussian packed
+    lower triangle (row-major), i.e. element (i, j)
+    with i >= j is packed[i*(i+1)/2 + j]
+    """
+
+    def __init__(self, packed, n=None):
+        self.packed = np.asarray(packed, dtype=float)
+        if n is None:
+            n = int((np.sqrt(8 * self.packed.size + 1) - 1) / 2)
+        if n * (n + 1) // 2 != self.packed.size:
+            raise ValueError(f'{self.packed.size} items do not fill a {n}x{n} triangle')
+        self.n = n
+        self.shape = (n, n)
+        self._row_start = np.arange(n) * (np.arange(n) + 1) // 2     # Row offsets in packed
+        self._diag = self._row_start + np.arange(n)
+
+    def packed_index(self, rows, cols):
+        """ 
+        Position in packed of elements (rows, cols),
+        broadcasting as numpy does
+        """
+        rows, cols = np.broadcast_arrays(rows, cols)
+        upper = np.maximum(rows, cols)
+        lower = np.minimum(rows, cols)
+        return self._row_start[upper] + lower
+
+    def diagonal(self):
+        return self.packed[self._diag]
+
+    def block(self, i, j, size=3):
+        """ 
+        (size x size) block of rows i*size... 
+        and columns j*size..., e.g. atoms i, j in XYZ
+        """
+        rows = np.arange(i * size, (i + 1) * size)
+        cols = np.arange(j * size, (j + 1) * size)
+        return self.packed[self.packed_index(rows[:, None], cols[None, :])]
+
+    def blocks(self, i, j, size=3):
+        """ 
+        Stacked (len(i), size, size) blocks (i[n], j[n])
+        gathered in one fancy indexing call
+        """
+        offs = np.arange(size)
+        rows = np.asarray(i)[:, None, None] * size + offs[None, :, None]
+        cols = np.asarray(j)[:, None, None] * size + offs[None, None, :]
+        return self.packed[self.packed_index(rows, cols)]
+
+    def to_dense(self):
+        dense = np.empty(self.shape)
+        low = np.tril_indices(self.n)
+        dense[low] = self.packed
+        dense[low[1], low[0]] = self.packed
+        return dense
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_dense() if dtype is None else self.to_dense().astype(dtype)
+
+    def __add__(self, other):
+        return PackedSymmetricMatrix(self.packed + other.packed, self.n)
+
+    def __sub__(self, other):
+        return PackedSymmetricMatrix(self.packed - other.packed, self.n)
+
+    def __mul__(self, scalar):
+        return PackedSymmetricMatrix(self.packed * scalar, self.n)
+
+    __rmul__ = __mul__
+
+
+def read_HessRIC(fchk, ric_list):
     """ 
     Reading Internal Hessian from fchk file:
-    all_lines : text file
+    fchk : FchkFile
     ric_list = [RICs, BONDs, ANGLEs, DIHEs]  
     """
+    hess_1D = fchk.get_reals('Internal Force Constants')
 
-    hess_list = []
-    for s in range(len(all_lines)):                          # Get no of Atoms
-        if 'Internal Force Constants' in all_lines[s]:
-            N_hess = int(all_lines[s][-10:])
-            nlines = int(N_hess/5.0) + 1
-            start = s
-            for e in range2(start + 1, start + nlines):
-                hess_list.append(all_lines[e].split() )
-    
-    hess_flat = flat_list(hess_list)
-
-    # Take out Garbage Strings
-    if len(hess_flat) != N_hess:
-        diff = abs(len(hess_flat)-N_hess)
-        # print('diff = ', diff)
-        hess_flat_mod = hess_flat[:-diff]
-        hess_1D = np.array(hess_flat_mod, float)
-    else:
-        hess_1D = np.array(hess_flat,float)
+    return PackedSymmetricMatrix(hess_1D, ric_list[0])
 
-    
-    # hess_1D_mod = np.append(hess_1D, [0])
-    # print(hess_1D_mod)
-
-    # print(len(hess_1D))
-    ric_len = ric_list[0]
-    # print(ric_len)
-    hess_arr = np.zeros((ric_len, ric_len))
-    # print(hess_arr.shape, hess_arr.size)
-    for i in range(ric_len+1):
-        # i_low = int( 0.5 * i * (i - 1) + -1 )           # Adding n(n+1)/2 elements in up/low triangular matrix
-        i_low = int( 0.5 * i * (i - 1)  )           # Adding n(n+1)/2 elements in up/low triangular matrix
-        # i_up = int( 0.5 * i *  (i + 1) + 1 )
-        i_up = int( 0.5 * i *  (i + 1)   )
-        # print(i, i_low, i_up, hess_1D[i_low:i_up])
-        hess_arr[i-1,0:i] =  hess_1D[i_low: i_up]
-        hess_arr[0:i,i-1] =  hess_1D[i_low: i_up]
-
-    return hess_arr
-
-def read_HessXYZ(all_lines, N_atom):
+def read_HessXYZ(fchk, N_atom):
     """ 
     Reading XYZ Hessian from fchk file:
-    all_lines : text file
+    fchk : FchkFile
     """
+    return packed_HessXYZ(fchk.get_reals('Cartesian Force Constants'), N_atom)
 
-    hess_list = []
-    for s in range(len(all_lines)):                          # Get no of Atoms
-        if 'Cartesian Force Constants' in all_lines[s]:
-            N_hess = int(all_lines[s][-10:])
-            nlines = int(N_hess/5.0) + 1
-            start = s
-            for e in range2(start + 1, start + nlines):
-                hess_list.append(all_lines[e].split() )
-    
-    hess_flat = flat_list(hess_list)
-
-    # Take out Garbage Strings
-    if len(hess_flat) != N_hess:
-        diff = abs(len(hess_flat)-N_hess)
-        # print('diff = ', diff)
-        hess_flat_mod = hess_flat[:-diff]
-        hess_1D = np.array(hess_flat_mod, float)
-    else:
-        hess_1D = np.array(hess_flat,float)
-
+def packed_HessXYZ(hess_1D, N_atom):
+    """
+    XYZ Hessian from a packed one in Hartree/bohr^2 (fchk order),
+    in the units of read_HessXYZ
+    """
     hess_1D = hess_1D * ((627.509391)/(0.529117*0.529117))   # From Hartree/bohr to kcal/mol / angstrom
-    # hess_1D_mod = np.append(hess_1D, [0])
-    # print(hess_1D_mod)
 
-    # print(len(hess_1D))
-    len_hess = 3*N_atom
-    hess_XYZ = np.zeros((len_hess, len_hess))
-    # print(hess_arr.shape, hess_arr.size)
-    for i in range(len_hess + 1):
-        # i_low = int( 0.5 * i * (i - 1) + -1 )        # Adding n(n+1)/2 elements in up/low triangular matrix
-        i_low = int( 0.5 * i * (i - 1)  )              # Adding n(n+1)/2 elements in up/low triangular matrix
-        # i_up = int( 0.5 * i *  (i + 1) + 1 )
-        i_up = int( 0.5 * i *  (i + 1)   )
-        # print(i, i_low, i_up, hess_1D[i_low:i_up])
-        hess_XYZ[i-1,0:i] =  hess_1D[i_low: i_up]
-        hess_XYZ[0:i,i-1] =  hess_1D[i_low: i_up]
-
-    return hess_XYZ
+    return PackedSymmetricMatrix(hess_1D, 3*N_atom)
 
 
 def read_NamesTypes(all_lines):
@@ -226,37 +261,85 @@ def read_NamesTypes(all_lines):
     return ele_list, atype_list
     
 
-def read_Top(all_lines, ric_list):
+def iter_lines(fname):
     """ 
-    Reading Topology from RIC:
+    Yielding stripped lines of any file, 
+    one at a time (bounded memory)
+    """
+    with open(fname, 'r') as f:
+        for line in f:
+            yield line.strip()
+
+def scan_log(all_lines, ric_tot=None, N_atoms=None, charges='cm5', orientation=None):
+    """ 
+    Single pass over a Gaussian log (list or iter_lines):
+    ric_tot : read the first RIC definition table ('R(1,2)', ...)
+    N_atoms : read CM5 charges, or Mulliken if CM5 is missing;
+              charges='mulliken' takes Mulliken directly
+    orientation : None, 'first', 'last' or 'all' Input orientation blocks
+                  as (atomic numbers, XYZ) arrays
+    Stops as soon as everything requested has been found
     """
-    tmp_list = []
-    ric_tot = ric_list[0]
-    for s in range(len(all_lines)):                          # Get no of Atoms
-        if 'Name' in all_lines[s]:
-            start = s
-            # print(all_lines[s])
-            for e in range(start+2, start + ric_tot+2):
-                tmp_list.append(all_lines[e][8:25].strip())
+    match_cm5 = 'Hirshfeld charges, spin densities, dipoles, and CM5 charges using IRadAn=      5:'
+    match_mull = 'Mulliken charges:'
+    match_orient = 'Input orientation:'
+    lines = iter(all_lines)
+    ric_def, cm5, mulliken = None, None, None
+    orient_list = []
+
+    def found_all():
+        return (ric_tot is None or ric_def is not None) and \
+               (N_atoms is None or cm5 is not None or (charges == 'mulliken' and mulliken is not None)) and \
+               (orientation in (None, 'first') and (orientation is None or orient_list))
+
+    for line in lines:
+        if ric_tot is not None and ric_def is None and 'Name' in line:
+            next(lines)
+            ric_def = [next(lines)[8:25].strip() for _ in range(ric_tot)]
+        elif N_atoms is not None and cm5 is None and charges == 'cm5' and match_cm5 in line:
+            next(lines)
+            cm5 = [next(lines).split()[7] for _ in range(N_atoms)]
+        elif N_atoms is not None and mulliken is None and match_mull in line:
+            next(lines)
+            mulliken = [next(lines).split()[2] for _ in range(N_atoms)]
+        elif orientation is not None and match_orient in line:
+            for _ in range(4):
+                next(lines)
+            block = []
+            for row in lines:
+                if '----' in row:
+                    break
+                block.append(row.split())
+            block = np.array(block)
+            orient = (block[:, 1].astype(int), block[:, 3:6].astype(float))
+            if orientation == 'last':
+                orient_list = [orient]
+            else:
+                orient_list.append(orient)
+        if found_all():
             break
-   
 
-    n_bonds = 0
-    n_angles = 0
-    n_dihe = 0
+    # If CM5 not found, using Mulliken; add '+' to positive charge
+    chg = cm5 if cm5 is not None else (mulliken or [])
+    chg = [x if x[0] == '-' else '+' + x for x in chg]
+
+    return {'ric': ric_def or [], 'charges': chg, 'orientations': orient_list}
+
+def ric2lists(ric_def):
+    """ 
+    Splitting RIC definitions into bond, angle 
+    and dihedral lists of atom indices
+    """
     bond_list = []
     angle_list = []
     dihe_list = []
-    for i in range(len(tmp_list)):
-        if tmp_list[i][0] == 'R':
-           n_bonds += 1 
-           bond_list.append(tmp_list[i][2 : -1].replace(','," ").split())
-        elif tmp_list[i][0] == 'A':
-           n_angles += 1 
-           angle_list.append(tmp_list[i][2 : -1].replace(','," ").split())
-        elif tmp_list[i][0] == 'D':
-           n_dihe += 1 
-           dihe_list.append(tmp_list[i][2 : -1].replace(','," ").split())
+    for item in ric_def:
+        if item[0] == 'R':
+           bond_list.append(item[2 : -1].replace(','," ").split())
+        elif item[0] == 'A':
+           angle_list.append(item[2 : -1].replace(','," ").split())
+        elif item[0] == 'D':
+           dihe_list.append(item[2 : -1].replace(','," ").split())
 
     bond_list = [list(map(int, x)) for x in bond_list]
     angle_list = [list(map(int, x)) for x in angle_list]
@@ -264,74 +347,110 @@ def read_Top(all_lines, ric_list):
 
     return bond_list, angle_list, dihe_list
 
+def read_Top(all_lines, ric_list):
+    """ 
+    Reading Topology from RIC:
+    all_lines : list of lines or iter_lines(fname)
+    """
+    ric_def = scan_log(all_lines, ric_tot=ric_list[0])['ric']
 
-def read_CM5(all_lines, N_atoms):
-         """ 
-         Reading CM5 charges from log file 
-         """
-         match = 'Hirshfeld charges, spin densities, dipoles, and CM5 charges using IRadAn=      5:'
-         match_2 = 'Mulliken charges:'
-         text = []
-
-         if match in all_lines:
-             for s in range(len(all_lines)):                            
-                 if match in all_lines[s]:                              
-                     start = s
-                     for e in range2(start + 2, start + N_atoms+1):
-                         text.append(all_lines[e].split())
-                     break
-             chg = [ x[7] for x in text ]
-         else:                                                       # If CM5 not found, using Mulliken
-             for s in range(len(all_lines)):                            
-                 if match_2 in all_lines[s]:                            
-                     start = s
-                     for e in range2(start + 2, start + N_atoms+1):
-                         text.append(all_lines[e].split())
-                     break
-             
-             chg = [ x[2] for x in text ]
-
-         # Add '+' to positive charge
-         chg_mod = []
-         for x in chg:
-             if x[0] != '-':
-                tmp = '+' + x
-             else:
-                tmp = x
-             chg_mod.append(tmp)
-
-         return chg_mod
-
-def read_AmberParm(path, type_list):
-    fname = path + '/amber.prm'
-    with open(fname, 'r') as f:
-       all_lines = []
-       for line in f:
-           all_lines.append(line.strip()) 
+    return ric2lists(ric_def)
 
-    Amber_list = []
-    for s in range(len(all_lines)):                          #  Get CC Coordinates
-        if 'VDW' in all_lines[s]:                              #Reads the Input orientation information
-            # start = s
-            # for e in range(start + 1, len(all_lines)):
-            Amber_list.append(all_lines[s].split() )
 
-    VDW_list = []
-    for i in type_list:
-        for j in Amber_list:
-            if i == j[1]:
-                VDW_list.append(j)
+def read_CM5(all_lines, N_atoms):
+    """ 
+    Reading CM5 charges from log file 
+    all_lines : list of lines or iter_lines(fname)
+    """
+    return scan_log(all_lines, N_atoms=N_atoms)['charges']
 
-    VDW_new = []
-    for i in VDW_list:
-        if i not in VDW_new:
-            VDW_new.append(i)
-        
-    return VDW_new
+PRM_KINDS = ('NonBon', 'VDW', 'HrmStr1', 'HrmBnd1', 'AmbTrs', 'ImpTrs')
+PRM_NTYPES = {'VDW': 1, 'HrmStr1': 2, 'HrmBnd1': 3, 'AmbTrs': 4, 'ImpTrs': 4}
 
+def read_prm(fname):
+    """ 
+    One pass over an amber.prm like file:
+    raw lines grouped by kind, in file order
+    """
+    records = {kind: [] for kind in PRM_KINDS}
+    with open(fname, 'r') as f:
+        for line in f:
+            kind = line.split(None, 1)
+            if kind and kind[0] in records:
+                records[kind[0]].append(line.strip())
+    return records
 
+def type_key(types):
+    """ 
+    Direction invariant key of a bond/angle/torsion type
+    """
+    types = tuple(types)
+    return min(types, types[::-1])
 
-    
+class AmberParm:
+    """ 
+    Parameter database of an amber.prm file, hash indexed by
+    atom type(s): VDW by type, bonds, angles and torsions by
+    direction invariant type keys (first record wins, ImpTrs 
+    as written). Each index is built on its first query
+    """
 
-   
+    def __init__(self, records):
+        self.records = records
+        self._index = {}
+        nonbon = records.get('NonBon')
+        self.nonbon = nonbon[0].split() if nonbon else None
+
+    @classmethod
+    def from_file(cls, fname):
+        return cls(read_prm(fname))
+
+    def index(self, kind):
+        if kind not in self._index:
+            n = PRM_NTYPES[kind]
+            index = {}
+            for line in self.records.get(kind, []):
+                rec = line.split()
+                if kind == 'VDW':
+                    recs = index.setdefault(rec[1], [])
+                    if rec not in recs:                          # Drop repeated lines
+                        recs.append(rec)
+                elif kind == 'ImpTrs':
+                    index.setdefault(tuple(rec[1:n+1]), rec)
+                else:
+                    index.setdefault(type_key(rec[1:n+1]), rec)
+            self._index[kind] = index
+        return self._index[kind]
+
+    def vdw(self, type_list):
+        """ 
+        VDW records of the types in type_list, 
+        each type once and in order of appearance
+        """
+        index = self.index('VDW')
+        VDW_list = []
+        for i in dict.fromkeys(type_list):
+            VDW_list.extend(index.get(i, []))
+        return VDW_list
+
+    def bond(self, a, b):
+        return self.index('HrmStr1').get(type_key((a, b)))
+
+    def angle(self, a, b, c):
+        return self.index('HrmBnd1').get(type_key((a, b, c)))
+
+    def torsion(self, a, b, c, d):
+        """ 
+        Specific record first, then the generic X-b-c-X one
+        """
+        index = self.index('AmbTrs')
+        rec = index.get(type_key((a, b, c, d)))
+        if rec is None:
+            rec = index.get(type_key(('X', b, c, 'X')))
+        return rec
+
+    def improper(self, a, b, c, d):
+        return self.index('ImpTrs').get((a, b, c, d))
 
+def read_AmberParm(path, type_list):
+    return AmberParm.from_file(path + '/amber.prm').vdw(type_list)
@@ -44,9 +44,17 @@ def read_optfile(fname):
         raise FileNotFoundError('Missing JSON file')
     with open(fname, 'r')  as fopen:
         data = json.load(fopen)
-    for i in ["log_qm_file", "fchk_qm_file", "atype_file", "fchk_mm_file", "fchk_nb_file"]:
-        if not os.path.exists(data['files'][i]):
+    if "fchk_mm_file" not in data['files']:                   # MM Hessians from the build_4Smart inputs
+        data['files'].setdefault("gjf_mm_file", "GauHarm.gjf")
+    if "fchk_nb_file" not in data['files']:
+        data['files'].setdefault("gjf_nb_file", "GauNonBon.gjf")
+    for i in ["log_qm_file", "fchk_qm_file", "atype_file", "fchk_mm_file", "gjf_mm_file",
+              "fchk_nb_file", "gjf_nb_file"]:
+        if i in data['files'] and not os.path.exists(data['files'][i]):
             raise FileNotFoundError(f'Missing {i} file')
+    for i in ["log_qm_file", "fchk_qm_file", "atype_file"]:
+        if i not in data['files']:
+            raise KeyError(f'Missing {i} in {fname}')
     return data
 
 def read_optfile_2(fname):
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from gauScan2com import atomic_number
+
+match_modred = " The following ModRedundant input section has been read:"
+match_vars = "       Variables:"
+match_ric = " ! Name  Definition              Value          Derivative Info."
+match_summary = " Summary of Optimized Potential Surface Scan"
+match_opt = "Optimized Parameters"
+match_orient = "Input orientation:"
+match_mm = " Energy="
+match_qm = " SCF Done:"
+
+
+def atoi(text):
+    return int(text) if text.isdigit() else text
+
+def natural_keys(text):
+    '''
+    alist.sort(key=natural_keys) sorts in human order
+    http://nedbatchelder.com/blog/200712/human_sorting.html
+    (See Toothy's implementation in the comments)
+    '''
+    return [ atoi(c) for c in re.split(r'(\d+)', text) ]
+
+def commandline_parser():
+    parser = argparse.ArgumentParser(prog='scan_extract.py', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('filelist', nargs='+', help='Gaussian scan (QM/MM) or single point log files')
+    parser.add_argument('-o', default='scan.npz', help='output file, .npz or .csv; default = scan.npz')
+    parser.add_argument('-n', '--nprocs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--geom', action='store_true', help='store the optimized geometries (.npz only)')
+    return parser
+
+def scan_id(fname):
+    """
+    Key of a log file: its name without extension;
+    single points 'x_mm_14.log' are grouped as 'x_mm'
+    """
+    name = os.path.splitext(os.path.basename(fname))[0]
+    return re.sub(r'_mm_\d+$', '_mm', name)
+
+def read_scan(fname, geometries=False, kind=None):
+    """
+    Single pass over a Gaussian log:
+    relaxed scan (ModRedundant or z-matrix Variables) -> start, step,
+    scan angles phi, energies of the optimized points and the
+    scanned dihedral (ModRedundant);
+    otherwise the single point energy (' Energy=' of MM or
+    ' SCF Done:' of QM, detected unless kind is 'mm' or 'qm').
+    With geometries=True, the first orientation after each
+    'Optimized Parameters' (the first one of a single point) is
+    returned as elements (n_atoms) and coords (n_points, n_atoms, 3)
+    """
+    start = step = add = scanned = None
+    energy, sp_mm, sp_qm, frames = [], [], [], []
+    numbers, first_frame = [], None
+    in_ric = in_vars = in_summary = pending = False
+    modred = start_seen = False
+    with open(fname, 'r') as f:
+        for line in f:
+            if in_summary and line.find('Eigenvalues') == 5:
+                energy.extend(float(x) for x in line.split()[2:])
+                continue
+            if in_ric:                                      # First RIC table: scanned value
+                if line[:4] == ' ---':
+                    in_ric = False
+                    start_seen = True
+                    continue
+                x = line.split()
+                if len(x) == 6:
+                    start = float(x[3])
+                continue
+            if in_vars:                                     # z-matrix: name value S N step
+                if line == ' \n':
+                    in_vars = False
+                    continue
+                x = line.split()
+                if len(x) == 5:
+                    start, step = float(x[1]), float(x[4])
+                continue
+            if line[:56] == match_modred:
+                x = f.readline().split()
+                if 'S' in x:                                # Not a frozen (F) coordinate
+                    step = float(x[x.index('S') + 2])
+                if x[0] == 'D':
+                    scanned = [int(v) for v in x[1:5]]
+                modred = True
+            elif line[:64] == match_ric and modred and not start_seen:
+                f.readline()
+                in_ric = True
+            elif line[:17] == match_vars and not modred:
+                in_vars = True
+            elif line[:44] == match_summary:
+                add = float(line[50:line.find('to')])
+                in_summary = True
+            elif line[:8] == match_mm:
+                sp_mm.append(float(line[11:28]))
+            elif line[:10] == match_qm:
+                sp_qm.append(float(line[23:40]))
+            elif geometries and match_opt in line:
+                pending = True
+            elif geometries and (pending or first_frame is None) and match_orient in line:
+                for _ in range(4):                          # Table header
+                    f.readline()
+                block = []
+                for row in f:
+                    if '----' in row:
+                        break
+                    block.append(row.split())
+                block = np.array(block)
+                numbers = block[:, 1].astype(int)
+                if pending:
+                    frames.append(block[:, 3:6].astype(float))
+                else:
+                    first_frame = block[:, 3:6].astype(float)
+                pending = False
+
+    res = {'fname': fname, 'scan_id': scan_id(fname)}
+    if step is not None:                                    # Scan; no summary if unfinished
+        res['energy'] = np.array(energy) + (add or 0.0)
+        phi = [start]
+        for i in range(len(energy) - 1):                    # Same accumulation as the scan
+            phi.append(phi[-1] + step)
+        res['phi'] = np.array(phi[:len(energy)], dtype=float)
+        res['start'], res['step'] = start, step
+        res['dihedral'] = scanned                           # 1 based, ModRedundant D scans
+    else:
+        sp = {'mm': sp_mm, 'qm': sp_qm}.get(kind, sp_mm or sp_qm)
+        res['energy'] = np.array(sp, dtype=float)
+        res['phi'] = np.full(len(res['energy']), np.nan)
+        if not frames and first_frame is not None:
+            frames = [first_frame]
+    if geometries:
+        res['elements'] = np.array([atomic_number.get(str(x)) for x in numbers])
+        res['coords'] = np.array(frames).reshape(len(frames), len(numbers), 3)
+    return res
+
+def read_scans(file_list, nprocs=1, geometries=False, kind=None):
+    """
+    read_scan over many files through a process pool,
+    results in natural file order
+    """
+    file_list = sorted(file_list, key=natural_keys)
+    func = partial(read_scan, geometries=geometries, kind=kind)
+    if nprocs <= 1 or len(file_list) < 2:
+        return [func(f) for f in file_list]
+    chunk = max(1, len(file_list) // (4 * nprocs))
+    with ProcessPoolExecutor(max_workers=nprocs) as pool:
+        return list(pool.map(func, file_list, chunksize=chunk))
+
+def to_columns(results):
+    """
+    One row per point: scan_id, point, phi, energy
+    (single point files of the same scan are stacked in order)
+    """
+    ids, points, phi, energy = [], [], [], []
+    count = {}
+    for res in results:
+        n = len(res['energy'])
+        first = count.get(res['scan_id'], 0)
+        count[res['scan_id']] = first + n
+        ids.extend([res['scan_id']] * n)
+        points.extend(range(first, first + n))
+        phi.append(res['phi'])
+        energy.append(res['energy'])
+    return {'scan_id': np.array(ids, dtype=str),
+            'point': np.array(points, dtype=int),
+            'phi': np.concatenate(phi) if phi else np.zeros(0),
+            'energy': np.concatenate(energy) if energy else np.zeros(0)}
+
+def point_frames(res):
+    """
+    Geometries of a read_scan result, one per energy row
+    (NaN where a point has none)
+    """
+    n = len(res['energy'])
+    coords = res['coords'][:n]
+    if len(coords) < n:
+        gap = np.full((n - len(coords),) + coords.shape[1:], np.nan)
+        coords = np.concatenate((coords, gap))
+    return coords
+
+def write_scans(fout, results):
+    """
+    Write the columnar result set as .npz (with geometries,
+    if read, as coords_<scan_id>/elements_<scan_id>, the frames
+    of the files of a scan id stacked as their points) or as CSV
+    """
+    cols = to_columns(results)
+    if fout.endswith('.npz'):
+        groups = {}
+        for res in results:
+            if 'coords' in res:
+                groups.setdefault(res['scan_id'], []).append(res)
+        for key, group in groups.items():
+            n_atoms = max(len(res['elements']) for res in group)
+            cols['coords_' + key] = np.concatenate([point_frames(res) if len(res['elements']) else
+                                                    np.full((len(res['energy']), n_atoms, 3), np.nan)
+                                                    for res in group])
+            cols['elements_' + key] = next(res['elements'] for res in group if len(res['elements']) == n_atoms)
+        np.savez(fout, **cols)
+        return
+    with open(fout, 'w') as fopen:
+        fopen.write('scan_id,point,phi,energy\n')
+        for row in zip(cols['scan_id'], cols['point'], cols['phi'], cols['energy']):
+            fopen.write(f'{row[0]},{row[1]},{float(row[2])!r},{float(row[3])!r}\n')
+
+def main():
+    parser = commandline_parser()
+    opts = parser.parse_args()
+    geom = opts.geom and opts.o.endswith('.npz')
+    results = read_scans(opts.filelist, opts.nprocs, geom)
+    write_scans(opts.o, results)
+
+if __name__ == "__main__":
+    main()
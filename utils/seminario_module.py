@@ -48,10 +48,11 @@ def bond_force_constant(diff_AB, r_AB, WR, VR,):
 
 
 def get_ModSem_FcBonds(i, j, diff_AB, r_AB, hess):
-    sub_hess = hess[(i * 3):((i + 1)*3),(j * 3):((j + 1)*3)]
+    # hess: PackedSymmetricMatrix
+    sub_hess = hess.block(i, j)
     WR, VR = np.linalg.eig(sub_hess)
     k_AB = bond_force_constant(diff_AB, r_AB, WR, VR)
-    sub_hess = hess[(j * 3):((j + 1)*3),(i * 3):((i + 1)*3)]
+    sub_hess = hess.block(j, i)
     WR, VR = np.linalg.eig(sub_hess)
     k_BA = bond_force_constant(diff_AB, r_AB, WR, VR)
     kk = (k_AB + k_BA)/2.0
@@ -59,17 +60,102 @@ def get_ModSem_FcBonds(i, j, diff_AB, r_AB, hess):
     return kk
 
 def get_ModSem_FcAngles(i, j, k, r_AB, r_BC, u_AB, u_BC, hess):
-    sub_hess_AB = hess[(i * 3):((i + 1)*3),(j * 3):((j + 1)*3)]
+    sub_hess_AB = hess.block(i, j)
     WR_AB, VR_AB = np.linalg.eig(sub_hess_AB)
-    sub_hess_BC = hess[(j * 3):((j + 1)*3),(k * 3):((k + 1)*3)]
+    sub_hess_BC = hess.block(j, k)
     WR_BC, VR_BC = np.linalg.eig(sub_hess_BC)
     k_angle = angle_force_constant(r_AB, r_BC, u_AB, u_BC, \
                                    WR_AB, VR_AB, WR_BC, VR_BC)
     
     return k_angle
 
-    
-    
 
-
-    
+def unit_rows(vec):
+    return vec / np.linalg.norm(vec, axis=-1, keepdims=True)
+
+def projected_eigs(WR, VR, u):
+    """ 
+    sum_m WR[n,m] * |u[n] . VR[n,:,m]| for all n
+    """
+    return np.einsum('nm,nm->n', WR, np.abs(np.einsum('nk,nkm->nm', u, VR)))
+
+class PairEigenCache:
+    """ 
+    Eigen decompositions of the (i, j) 3x3 blocks of a Hessian,
+    shared by all bond and angle terms: each ordered atom pair
+    is decomposed once (batched), later requests are hits
+    """
+
+    def __init__(self, hess):
+        self.hess = hess                                        # PackedSymmetricMatrix
+        self.index = {}
+        self.WR = np.zeros((0, 3))
+        self.VR = np.zeros((0, 3, 3))
+        self.hits = 0
+        self.misses = 0
+        self.eig_calls = 0
+
+    def get(self, i, j):
+        """ 
+        Stacked eigenvalues (n, 3) and eigenvectors (n, 3, 3)
+        of the blocks (i[n], j[n])
+        """
+        keys = list(zip(np.asarray(i).tolist(), np.asarray(j).tolist()))
+        new = [x for x in dict.fromkeys(keys) if x not in self.index]
+        self.misses += len(new)
+        self.hits += len(keys) - len(new)
+        if new:
+            new_i, new_j = np.array(new).T
+            WR, VR = np.linalg.eig(self.hess.blocks(new_i, new_j))
+            self.eig_calls += 1
+            self.index.update((x, len(self.WR) + n) for n, x in enumerate(new))
+            self.WR = np.concatenate((self.WR, WR))
+            self.VR = np.concatenate((self.VR, VR))
+        pos = np.array([self.index[x] for x in keys], dtype=int)
+        return self.WR[pos], self.VR[pos]
+
+    def stats(self):
+        return {'pairs': len(self.index), 'hits': self.hits, 
+                'misses': self.misses, 'eig_calls': self.eig_calls}
+
+def eigen_cache(hess):
+    return hess if isinstance(hess, PairEigenCache) else PairEigenCache(hess)
+
+def ModSem_FcBonds(bond_idx, coords, hess):
+    """ 
+    All bond force constants at once:
+    bond_idx (n, 2) zero based atoms, hess: PackedSymmetricMatrix
+    or the PairEigenCache shared with the angles
+    """
+    bond_idx = np.asarray(bond_idx, dtype=int).reshape(-1, 2)
+    i, j = bond_idx[:, 0], bond_idx[:, 1]
+    n = len(i)
+    WR, VR = eigen_cache(hess).get(np.concatenate((i, j)), np.concatenate((j, i)))
+    u_AB = unit_rows(coords[i] - coords[j])
+    k = -0.5 * projected_eigs(WR, VR, np.concatenate((u_AB, u_AB)))
+    return ((k[:n] + k[n:]) / 2.0).real
+
+def ModSem_FcAngles(angle_idx, coords, hess):
+    """ 
+    All angle force constants at once:
+    angle_idx (n, 3) zero based atoms, hess: PackedSymmetricMatrix
+    or the PairEigenCache shared with the bonds
+    """
+    angle_idx = np.asarray(angle_idx, dtype=int).reshape(-1, 3)
+    i, j, k = angle_idx[:, 0], angle_idx[:, 1], angle_idx[:, 2]
+    n = len(i)
+    diff_AB = coords[i] - coords[j]
+    diff_BC = coords[j] - coords[k]
+    r_AB = np.linalg.norm(diff_AB, axis=1)
+    r_BC = np.linalg.norm(diff_BC, axis=1)
+    u_AB = diff_AB / r_AB[:, None]
+    u_BC = diff_BC / r_BC[:, None]
+
+    u_N = unit_rows(np.cross(u_BC, u_AB))
+    u_PA = unit_rows(np.cross(u_N, u_AB))
+    u_PC = unit_rows(np.cross(u_N, u_BC))
+
+    WR, VR = eigen_cache(hess).get(np.concatenate((i, j)), np.concatenate((j, k)))
+    k_P = projected_eigs(WR, VR, np.concatenate((u_PA, u_PC)))
+    k_theta = 1 / (1 / (r_AB**2 * k_P[:n]) + 1 / (r_BC**2 * k_P[n:]))
+    return np.abs(-k_theta * 0.5).real
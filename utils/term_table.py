@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+class TypeTable:
+    """
+    Atom type intern table: ids follow the sorted names, so
+    rows of ids sort as the space joined type strings do
+    """
+    __slots__ = ('names', 'index', 'atom_ids')
+
+    def __init__(self, type_list):
+        self.names = sorted(set(type_list))
+        self.index = {x: n for n, x in enumerate(self.names)}
+        self.atom_ids = np.array([self.index[x] for x in type_list], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.atom_ids)
+
+    def __iter__(self):
+        return (self.names[x] for x in self.atom_ids.tolist())
+
+    def terms(self, idx):
+        """
+        TermTypes of the zero based atom index array idx (n, width)
+        """
+        return TermTypes(self, self.atom_ids[np.asarray(idx, dtype=int)])
+
+    def label(self, row):
+        return ' '.join(self.names[x] for x in row)
+
+
+class TermTypes:
+    """
+    Type ids (n_terms, width) of one term kind, aligned with
+    its parameter arrays; the 'A B C' strings are only built
+    when iterated, i.e. when printed
+    """
+    __slots__ = ('table', 'ids')
+
+    def __init__(self, table, ids):
+        self.table = table
+        self.ids = np.asarray(ids, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.table.label(row) for row in self.ids.tolist())
+
+    def __getitem__(self, n):
+        if isinstance(n, (int, np.integer)):
+            return self.table.label(self.ids[n].tolist())
+        return TermTypes(self.table, self.ids[n])
+
+    def labels(self):
+        return list(self)
+
+    def unique(self):
+        """
+        Unique types (sorted), inverse indexes and counts
+        """
+        keys, inverse, counts = np.unique(self.ids, axis=0, return_inverse=True, return_counts=True)
+        return TermTypes(self.table, keys.reshape(-1, self.ids.shape[1])), inverse.reshape(-1), counts
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from scipy import sparse
+from internal_coords import as_index, InternalCoordinates
+import parser_gau as pgau
+
+
+def ric_index(bond_list, angle_list, dihe_list):
+    """
+    Zero based index arrays of the RIC lists of read_Top
+    (flat, 1 based)
+    """
+    return (as_index(np.array(bond_list, dtype=int) - 1, 2),
+            as_index(np.array(angle_list, dtype=int) - 1, 3),
+            as_index(np.array(dihe_list, dtype=int) - 1, 4))
+
+def bond_rows(coords, idx):
+    """
+    dr/dx of the bonds: (n, 2, 3) for atoms i, j
+    """
+    diff = coords[idx[:, 0]] - coords[idx[:, 1]]
+    u = diff / np.linalg.norm(diff, axis=1)[:, None]
+    return np.stack((u, -u), axis=1)
+
+def angle_rows(coords, idx):
+    """
+    dtheta/dx (radians) of the i-j-k bends: (n, 3, 3)
+    """
+    u = coords[idx[:, 0]] - coords[idx[:, 1]]
+    v = coords[idx[:, 2]] - coords[idx[:, 1]]
+    lu = np.linalg.norm(u, axis=1)[:, None]
+    lv = np.linalg.norm(v, axis=1)[:, None]
+    u, v = u / lu, v / lv
+    cos_t = np.einsum('ij,ij->i', u, v)[:, None]
+    sin_t = np.sqrt(np.clip(1 - cos_t**2, 0.0, None))
+    d_i = (cos_t * u - v) / (lu * sin_t)
+    d_k = (cos_t * v - u) / (lv * sin_t)
+    return np.stack((d_i, -d_i - d_k, d_k), axis=1)
+
+def dihedral_rows(coords, idx):
+    """
+    dphi/dx (radians) of the i-j-k-l torsions: (n, 4, 3),
+    Blondel-Karplus form (no singularity at 0 or 180)
+    """
+    F = coords[idx[:, 0]] - coords[idx[:, 1]]
+    G = coords[idx[:, 1]] - coords[idx[:, 2]]
+    H = coords[idx[:, 3]] - coords[idx[:, 2]]
+    A = np.cross(F, G)
+    B = np.cross(H, G)
+    A2 = np.einsum('ij,ij->i', A, A)[:, None]
+    B2 = np.einsum('ij,ij->i', B, B)[:, None]
+    lG = np.linalg.norm(G, axis=1)[:, None]
+    FG = np.einsum('ij,ij->i', F, G)[:, None]
+    HG = np.einsum('ij,ij->i', H, G)[:, None]
+    d_i = -lG / A2 * A
+    d_l = lG / B2 * B
+    d_j = -d_i + FG / (A2 * lG) * A - HG / (B2 * lG) * B
+    d_k = -d_l - FG / (A2 * lG) * A + HG / (B2 * lG) * B
+    return np.stack((d_i, d_j, d_k, d_l), axis=1)
+
+ROW_FUNCS = (bond_rows, angle_rows, dihedral_rows)
+
+def ric_values(coords, bond_idx=(), angle_idx=(), dihe_idx=()):
+    """
+    Bond lengths, angles and signed dihedrals (radians)
+    consistent with the rows of B
+    """
+    ic = InternalCoordinates(coords)
+    return (ic.bonds(bond_idx), np.radians(ic.angles(angle_idx)),
+            np.radians(ic.dihedrals(dihe_idx, signed=True)))
+
+def local_columns(idx):
+    """
+    Cartesian columns (n, 3 * width) of the atoms of each term
+    """
+    return (3 * idx[:, :, None] + np.arange(3)[None, None, :]).reshape(len(idx), -1)
+
+def local_second_derivatives(func, coords, idx, h=1e-5):
+    """
+    d2q/dx2 (n, 3w, 3w) of each term over its own atoms, by
+    central differences of the analytic rows func; every term
+    is displaced at once, 6w calls whatever the molecule size
+    """
+    n, width = idx.shape
+    local = np.asarray(coords, dtype=float)[idx].reshape(n * width, 3)
+    own = np.arange(n * width).reshape(n, width)
+    d2 = np.empty((n, 3 * width, 3 * width))
+    for a in range(width):
+        for c in range(3):
+            x = local.copy()
+            x[own[:, a], c] += h
+            plus = func(x, own).reshape(n, -1)
+            x[own[:, a], c] -= 2 * h
+            minus = func(x, own).reshape(n, -1)
+            d2[:, :, 3 * a + c] = (plus - minus) / (2 * h)
+    return 0.5 * (d2 + d2.transpose(0, 2, 1))
+
+def wilson_B(coords, bond_idx=(), angle_idx=(), dihe_idx=()):
+    """
+    Sparse Wilson B matrix (n_ric x 3N) of bonds, angles and
+    dihedrals (zero based index arrays), rows in that order;
+    coords (N, 3); angles in radians
+    """
+    coords = np.asarray(coords, dtype=float)
+    rows, cols, vals = [], [], []
+    start = 0
+    for idx, func, width in zip((bond_idx, angle_idx, dihe_idx), ROW_FUNCS, (2, 3, 4)):
+        idx = as_index(idx, width)
+        if len(idx):
+            d = func(coords, idx)                                   # (n, width, 3)
+            col = local_columns(idx)
+            row = np.broadcast_to(start + np.arange(len(idx))[:, None], col.shape)
+            rows.append(row.ravel())
+            cols.append(col.ravel())
+            vals.append(d.ravel())
+        start += len(idx)
+    if not rows:
+        return sparse.csr_matrix((0, coords.size))
+    # Duplicated atoms in a term would be summed, as they should
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(start, coords.size))
+
+def generalized_inverse(B, tol=1e-8):
+    """
+    A = B^T G^- (3N x n_ric) with G = B B^T, the inverse
+    taken in the non-redundant (eigenvalue > tol) subspace
+    """
+    G = (B @ B.T).toarray() if sparse.issparse(B) else B @ B.T
+    w, V = np.linalg.eigh(G)
+    keep = w > tol * max(w.max(initial=0.0), 1.0)
+    G_inv = (V[:, keep] / w[keep]) @ V[:, keep].T
+    return np.asarray(B.T @ G_inv)
+
+def cart2ric_gradient(B, grad_xyz, tol=1e-8):
+    """
+    g_q = A^T g_x
+    """
+    return generalized_inverse(B, tol).T @ np.asarray(grad_xyz, dtype=float).ravel()
+
+def gradient_term(coords, ric_idx, grad_q, h=1e-5):
+    """
+    K = sum_i g_q,i d2q_i/dx2 (3N x 3N), assembled from the
+    local second derivatives of each term
+    """
+    coords = np.asarray(coords, dtype=float)
+    K = np.zeros((coords.size, coords.size))
+    start = 0
+    for idx, func, width in zip(ric_idx, ROW_FUNCS, (2, 3, 4)):
+        idx = as_index(idx, width)
+        if len(idx):
+            g = grad_q[start:start + len(idx)]
+            cols = local_columns(idx)
+            blocks = g[:, None, None] * local_second_derivatives(func, coords, idx, h)
+            np.add.at(K, (cols[:, :, None], cols[:, None, :]), blocks)
+        start += len(idx)
+    return K
+
+def cart2ric_hessian(B, hess_xyz, tol=1e-8, K=None):
+    """
+    H_q = A^T (H_x - K) A for a Cartesian Hessian (dense or
+    PackedSymmetricMatrix); K is the gradient term of
+    gradient_term, None at a stationary point. Returns
+    PackedSymmetricMatrix in the units of hess_xyz and of B
+    """
+    A = generalized_inverse(B, tol)
+    hess_x = np.asarray(hess_xyz, dtype=float)
+    if K is not None:
+        hess_x = hess_x - K
+    hess_q = A.T @ hess_x @ A
+    hess_q = 0.5 * (hess_q + hess_q.T)
+    return pgau.PackedSymmetricMatrix(hess_q[np.tril_indices(len(hess_q))], len(hess_q))
+
+def read_HessRIC(fchk, ric_list, bond_list, angle_list, dihe_list):
+    """
+    'Internal Force Constants' of fchk if stored (Freq=intmodes),
+    otherwise transformed from its Cartesian Hessian (and gradient)
+    through B; both in Hartree/Bohr^2, Hartree/rad^2
+    """
+    if 'Internal Force Constants' in fchk:
+        return pgau.read_HessRIC(fchk, ric_list)
+    N_atoms = fchk.get_scalar('Number of atoms')
+    xyz_bohr = np.reshape(fchk.get_reals('Current cartesian coordinates'), (N_atoms, 3))
+    ric_idx = ric_index(bond_list, angle_list, dihe_list)
+    B = wilson_B(xyz_bohr, *ric_idx)
+    hess_xyz = pgau.PackedSymmetricMatrix(fchk.get_reals('Cartesian Force Constants'), 3 * N_atoms)
+    K = None
+    if 'Cartesian Gradient' in fchk:                            # Off equilibrium, e.g. MM at QM geometry
+        grad_q = cart2ric_gradient(B, fchk.get_reals('Cartesian Gradient'))
+        K = gradient_term(xyz_bohr, ric_idx, grad_q)
+    return cart2ric_hessian(B, hess_xyz, K=K)